@@ -1,4 +1,14 @@
 /** @type {import('next').NextConfig} */
-const nextConfig = {};
+const nextConfig = {
+  // Forward game requests to the Flask backend so the browser can stream from the same origin
+  async rewrites() {
+    return [
+      {
+        source: '/api/:path*',
+        destination: `${process.env.BACKEND_URL || 'http://127.0.0.1:5000'}/:path*`,
+      },
+    ];
+  },
+};
 
 export default nextConfig;
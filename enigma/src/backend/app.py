@@ -1,28 +1,199 @@
-from flask import Flask, request, jsonify
-from exploration import IcosahedronGraph
+import json
+import os
+from flask import Flask, Response, request, jsonify, stream_with_context
+import clue_memo
+import compact
+import engine
+from llm import default_scheduler
+from metrics import call_context, llm_metrics
+from prefetch import prefetcher
+from exploration import IcosahedronGraph, INVESTIGATOR_PLACEHOLDER
+from topology import from_spec
+from world_cache import WorldCache
+from world_pool import WorldPool
+from sessions import SessionManager, SessionTooLarge, store_from_url
 
 app = Flask(__name__)
 
-# Initialize the game
-graph = None
+# LLM_TRACE_PATH=<file> writes one JSON line per LLM call and cache lookup
+if os.environ.get("LLM_TRACE_PATH"):
+    llm_metrics.enable_trace(os.environ["LLM_TRACE_PATH"])
 
-@app.route('/start', methods=['POST'])
-def start_game():
-    global graph
-    data = request.json
+# Names and intros for repeat themes are served from here instead of new API calls
+world_cache = WorldCache(os.environ.get("WORLD_CACHE_PATH", "world_cache.db"))
+
+# Clue text shared by every game of a theme; CLUE_REGENERATE_AFTER=N refreshes a clue after N views
+clue_store = WorldCache(os.environ.get("CLUE_CACHE_PATH", "clue_cache.db"), variants=1)
+clue_regenerate_after = int(os.environ["CLUE_REGENERATE_AFTER"]) if os.environ.get("CLUE_REGENERATE_AFTER") else None
+
+# LAZY_WORLDS=1 generates each room when a player first walks into it instead of up front
+lazy_worlds = os.environ.get("LAZY_WORLDS") == "1"
+
+# WORLD_TOPOLOGY picks the house layout, e.g. "dodecahedron", "grid:10x8" or "regular:500:3"
+# (see topology.from_spec); random layouts are drawn again for every world
+world_topology = os.environ.get("WORLD_TOPOLOGY", "icosahedron")
+
+def build_world(theme):
+    world = IcosahedronGraph(theme, INVESTIGATOR_PLACEHOLDER, batched=True, cache=world_cache,
+                             clue_regenerate_after=clue_regenerate_after, clue_store=clue_store, lazy=lazy_worlds,
+                             topology=from_spec(world_topology))
+    world._generate_intro()
+    return world
+
+# Ready-made worlds so /start does not wait on generation; sized with /pool/metrics
+popular_themes = [theme.strip() for theme in os.environ.get("POOL_THEMES", "").split(",") if theme.strip()]
+world_pool = WorldPool(
+    build_world,
+    depth=int(os.environ.get("POOL_DEPTH", 4)),
+    theme_depth=int(os.environ.get("POOL_THEME_DEPTH", 2)),
+    themes=popular_themes,
+)
+world_pool.start()
+
+# One game per player; SESSION_STORE=sqlite:<path> or redis://... lets several workers share them.
+# Games are saved in the compact binary format; SESSION_CODEC=pickle keeps the old one.
+session_idle_timeout = int(os.environ.get("SESSION_IDLE_TIMEOUT", 30 * 60))
+sessions = SessionManager(
+    store_from_url(os.environ.get("SESSION_STORE", "memory"), idle_timeout=session_idle_timeout),
+    idle_timeout=session_idle_timeout,
+    max_session_bytes=int(os.environ.get("SESSION_MAX_BYTES", 512 * 1024)),
+    codec=None if os.environ.get("SESSION_CODEC") == "pickle" else compact,
+)
+
+def session_id_from(data):
+    return data.get('session_id') or request.headers.get('X-Session-ID')
+
+def load_session(session_id):
+    state = sessions.get(session_id)
+    if state is not None:
+        state.graph.attach(cache=world_cache, clue_store=clue_store)
+    return state
+
+def render(response, session_id):
+    story = "\n".join(response['messages'] + ([response['prompt']] if response['prompt'] else []))
+    return jsonify(dict(response, story=story, session_id=session_id))
+
+# The turn itself is already saved; narration still writes into the game while it streams (clue
+# text, the intro, memo stats), so the game is saved again once the stream is done or abandoned
+def stream(chunks, session_id, state):
+    def events():
+        try:
+            with call_context(session=session_id):
+                for chunk in chunks:
+                    yield f"data: {json.dumps({'text': chunk})}\n\n"
+        except GeneratorExit:
+            try:
+                sessions.save(session_id, state)
+            except SessionTooLarge:
+                pass
+            raise
+        try:
+            sessions.save(session_id, state)
+        except SessionTooLarge as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps({'session_id': session_id})}\n\n"
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def new_game(data):
     name = data.get('name', 'Player')
     theme = data.get('theme', 'Default Theme')
-    graph = IcosahedronGraph(theme)
-    intro = graph._generate_intro()  # Adjust to return the introduction
-    return jsonify({'story': intro})
+    graph = world_pool.get_or_build(theme)
+    graph.set_investigator(name)
+    return graph
+
+@app.route('/start', methods=['POST'])
+def start_game():
+    state, response = engine.start(new_game(request.json))
+    try:
+        session_id = sessions.create(state)
+    except SessionTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    return render(response, session_id)
 
 @app.route('/input', methods=['POST'])
 def handle_input():
-    global graph
     data = request.json
-    user_input = data.get('input')
-    response = graph.navigate(user_input)  # Adjust to handle a single user input and return a response
-    return jsonify({'story': response})
+    session_id = session_id_from(data)
+    state = load_session(session_id)
+    if state is None:
+        return jsonify({'error': 'Unknown or expired session. Start a new game.'}), 404
+    with call_context(session=session_id):
+        state, response = engine.step(state, data.get('input'))
+    try:
+        sessions.save(session_id, state)
+    except SessionTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    return render(response, session_id)
+
+# Server-sent events versions of /start and /input: narration arrives as the model writes it
+@app.route('/start/stream', methods=['POST'])
+def start_game_stream():
+    state, chunks = engine.stream_start(new_game(request.json))
+    try:
+        session_id = sessions.create(state)
+    except SessionTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    return stream(chunks, session_id, state)
+
+@app.route('/input/stream', methods=['POST'])
+def handle_input_stream():
+    data = request.json
+    session_id = session_id_from(data)
+    state = load_session(session_id)
+    if state is None:
+        return jsonify({'error': 'Unknown or expired session. Start a new game.'}), 404
+    with call_context(session=session_id):
+        state, chunks = engine.stream_step(state, data.get('input'))
+    try:
+        sessions.save(session_id, state)
+    except SessionTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    return stream(chunks, session_id, state)
+
+# Layout for drawing the map: CSR adjacency plus the names of rooms the player has seen
+@app.route('/map', methods=['GET'])
+def game_map():
+    state = load_session(request.args.get('session_id') or request.headers.get('X-Session-ID'))
+    if state is None:
+        return jsonify({'error': 'Unknown or expired session. Start a new game.'}), 404
+    graph = state.graph
+    return jsonify(dict(
+        graph.topology.to_dict(),
+        rooms=[room.description if room.visited else None for room in graph.rooms],
+        current=state.room_index,
+    ))
+
+@app.route('/pool/metrics', methods=['GET'])
+def pool_metrics():
+    return jsonify(world_pool.metrics())
+
+@app.route('/clues/metrics', methods=['GET'])
+def clue_metrics():
+    with clue_memo.totals_lock:
+        return jsonify(clue_memo.totals)
+
+# Speculative calls started, used, cancelled before running and wasted; PREFETCH_BUDGET sizes them
+@app.route('/prefetch/metrics', methods=['GET'])
+def prefetch_metrics():
+    return jsonify(prefetcher.stats())
+
+# Rate-limit budgets, retries and how long each priority waited for the LLM
+@app.route('/scheduler/metrics', methods=['GET'])
+def scheduler_metrics():
+    return jsonify(default_scheduler().stats())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(llm_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/llm', methods=['GET'])
+def llm_metrics_json():
+    session_id = request.args.get('session_id')
+    if session_id:
+        return jsonify(llm_metrics.session(session_id))
+    return jsonify(llm_metrics.snapshot())
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,76 @@
+import asyncio
+import copy
+from quart import Quart, request, jsonify
+import app as shared
+import engine
+from coalesce import Coalescer
+from exploration import IcosahedronGraph, INVESTIGATOR_PLACEHOLDER
+from llm import default_async_backend
+from metrics import call_context
+from sessions import SessionTooLarge
+from topology import from_spec
+from world_cache import normalize_theme
+
+# ASGI version of /start and /input, e.g. `hypercorn async_app:app`. LLM calls go through one async
+# client with a shared connection pool, so a request waiting on the model does not hold a thread;
+# that includes building a world when the pool has none ready. The world pool (refilled by its own
+# background thread), caches and session store are the ones app.py sets up.
+app = Quart(__name__)
+llm = default_async_backend()
+builds = Coalescer()
+
+def render(response, session_id):
+    story = "\n".join(response['messages'] + ([response['prompt']] if response['prompt'] else []))
+    return jsonify(dict(response, story=story, session_id=session_id))
+
+# Same world as app.build_world, generated through the async backend
+async def build_world(theme):
+    return await IcosahedronGraph.abuild(theme, INVESTIGATOR_PLACEHOLDER, llm, cache=shared.world_cache,
+                                         clue_regenerate_after=shared.clue_regenerate_after,
+                                         clue_store=shared.clue_store, lazy=shared.lazy_worlds,
+                                         topology=from_spec(shared.world_topology))
+
+# Players starting the same theme while its world is being built share that one build; each gets
+# its own copy with a fresh crime
+async def new_game(data):
+    name = data.get('name', 'Player')
+    theme = data.get('theme', 'Default Theme')
+    graph = shared.world_pool.take(theme)
+    if graph is None:
+        built = await builds.run(normalize_theme(theme), lambda: build_world(theme))
+        graph = copy.deepcopy(built)
+        graph.attach(cache=shared.world_cache, clue_store=shared.clue_store)
+        graph.randomize_crime()
+    graph.set_investigator(name)
+    return graph
+
+@app.route('/start', methods=['POST'])
+async def start_game():
+    state, response = await engine.astart(await new_game(await request.get_json()), llm)
+    try:
+        session_id = await asyncio.to_thread(shared.sessions.create, state)
+    except SessionTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    return render(response, session_id)
+
+@app.route('/input', methods=['POST'])
+async def handle_input():
+    data = await request.get_json()
+    session_id = data.get('session_id') or request.headers.get('X-Session-ID')
+    state = await asyncio.to_thread(shared.load_session, session_id)
+    if state is None:
+        return jsonify({'error': 'Unknown or expired session. Start a new game.'}), 404
+    with call_context(session=session_id):
+        state, response = await engine.astep(state, data.get('input'), llm)
+    try:
+        await asyncio.to_thread(shared.sessions.save, session_id, state)
+    except SessionTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    return render(response, session_id)
+
+@app.route('/coalesce/metrics', methods=['GET'])
+async def coalesce_metrics():
+    return jsonify({'llm': llm.inflight.stats(), 'worlds': builds.stats()})
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import engine
+from exploration import IcosahedronGraph
+from llm import StubBackend, schedule, set_default_backend
+from metrics import llm_metrics
+from prefetch import prefetcher
+from scheduler import Scheduler
+
+# Scripted players: each turn picks one of these actions and answers any follow-up question
+ACTIONS = ["move", "move", "examine", "interact", "take", "inventory"]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+
+def summarize(samples, wall_time):
+    ops = {}
+    for op, values in samples.items():
+        ops[op] = {
+            "count": len(values),
+            "mean_ms": 1000 * sum(values) / len(values),
+            "p50_ms": 1000 * percentile(values, 0.50),
+            "p95_ms": 1000 * percentile(values, 0.95),
+            "p99_ms": 1000 * percentile(values, 0.99),
+            "max_ms": 1000 * max(values),
+        }
+    total = sum(len(values) for values in samples.values())
+    return {"wall_time_s": wall_time, "requests": total, "throughput_rps": total / wall_time if wall_time else 0.0, "ops": ops}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def timed(self, op, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.samples.setdefault(op, []).append(elapsed)
+
+
+class EngineClient:
+    # Drives engine.start/step in-process, the same path the CLI uses
+    def __init__(self, theme, lazy=False):
+        self.theme = theme
+        self.lazy = lazy
+        self.state = None
+
+    def start(self):
+        self.state, response = engine.start(IcosahedronGraph(self.theme, "Bot", lazy=self.lazy))
+        return response
+
+    def send(self, command):
+        self.state, response = engine.step(self.state, command)
+        return response
+
+
+class FlaskClient:
+    # Goes through the real Flask routes, sessions and world pool via the test client
+    def __init__(self, flask_app, theme):
+        self.client = flask_app.test_client()
+        self.theme = theme
+        self.session_id = None
+
+    def start(self):
+        data = self.client.post("/start", json={"name": "Bot", "theme": self.theme}).get_json()
+        self.session_id = data["session_id"]
+        return data
+
+    def send(self, command):
+        return self.client.post("/input", json={"session_id": self.session_id, "input": command}).get_json()
+
+
+def play(client, recorder, turns, rng):
+    response = recorder.timed("start", client.start)
+    for _ in range(turns):
+        if response.get("done"):
+            break
+        action = rng.choice(ACTIONS)
+        if action == "move":
+            options = recorder.timed("move", client.send, "1")["options"]
+            response = recorder.timed("move", client.send, str(rng.randint(1, max(1, len(options)))))
+        elif action == "examine":
+            response = recorder.timed("examine", client.send, "2")
+        elif action == "interact":
+            response = recorder.timed("interact", client.send, "5")
+            if response["prompt"].startswith("Choose an NPC"):
+                response = recorder.timed("interact", client.send, str(rng.randint(1, len(response["options"]))))
+        elif action == "take":
+            items = recorder.timed("take", client.send, "3")["options"]
+            response = recorder.timed("take", client.send, rng.choice(items) if items else "nothing")
+        else:
+            response = recorder.timed("inventory", client.send, "4")
+
+
+def run(make_client, sessions, turns, seed):
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        futures = [executor.submit(play, make_client(i), recorder, turns, random.Random(seed + i)) for i in range(sessions)]
+        # A session that dies (an error response without "options", a failed call) counts once,
+        # by exception type
+        failed = {}
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failed[type(e).__name__] = failed.get(type(e).__name__, 0) + 1
+    result = summarize(recorder.samples, time.perf_counter() - started)
+    result["errors"] = recorder.errors
+    result["failed_sessions"] = sum(failed.values())
+    result["session_errors"] = failed
+    return result
+
+
+def load_app(pool_depth, lazy=False):
+    # The app reads its configuration at import time; keep every store in memory for a clean run
+    os.environ["WORLD_CACHE_PATH"] = ""
+    os.environ["CLUE_CACHE_PATH"] = ""
+    os.environ["SESSION_STORE"] = "memory"
+    os.environ["POOL_DEPTH"] = str(pool_depth)
+    os.environ["LAZY_WORLDS"] = "1" if lazy else ""
+    import app
+    return app
+
+
+def wait_for_pool(pool, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        pools = pool.metrics()["pools"].values()
+        if all(metrics["depth"] >= metrics["target"] for metrics in pools):
+            return
+        time.sleep(0.05)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark world generation and play sessions against a stubbed LLM.")
+    parser.add_argument("--target", choices=["engine", "flask", "both"], default="both")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent scripted players")
+    parser.add_argument("--turns", type=int, default=20, help="actions per player")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="simulated latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of LLM calls that fail with a 429")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--rpm", type=int, default=500, help="scheduler requests-per-minute budget")
+    parser.add_argument("--tpm", type=int, default=200000, help="scheduler tokens-per-minute budget")
+    parser.add_argument("--concurrency", type=int, default=32, help="scheduler limit on calls in flight")
+    parser.add_argument("--theme", default="Default Theme")
+    parser.add_argument("--pool-depth", type=int, default=4)
+    parser.add_argument("--cold", action="store_true", help="start playing before the world pool has filled")
+    parser.add_argument("--lazy", action="store_true", help="generate rooms on first visit instead of up front")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    backend = StubBackend(latency=args.latency, jitter=args.jitter, seed=args.seed,
+                          error_rate=args.error_rate, retry_after=args.retry_after)
+    # Small base delay so injected 429s are retried on the benchmark's time scale
+    scheduler = Scheduler(rpm=args.rpm, tpm=args.tpm, max_concurrency=args.concurrency, base_delay=0.05, seed=args.seed)
+    set_default_backend(schedule(backend, scheduler))
+    results = {"config": vars(args), "targets": {}}
+    if args.target in ("engine", "both"):
+        results["targets"]["engine"] = run(lambda i: EngineClient(args.theme, args.lazy), args.sessions, args.turns, args.seed)
+    if args.target in ("flask", "both"):
+        app = load_app(args.pool_depth, args.lazy)
+        if not args.cold:
+            wait_for_pool(app.world_pool)
+        results["targets"]["flask"] = run(lambda i: FlaskClient(app.app, args.theme), args.sessions, args.turns, args.seed)
+        results["targets"]["flask"]["pool"] = app.world_pool.metrics()
+        app.world_pool.stop()
+    results["llm_calls"] = backend.calls
+    results["llm_errors_injected"] = backend.errors
+    results["scheduler"] = scheduler.stats()
+    results["prefetch"] = prefetcher.stats()
+    results["llm"] = {key: value for key, value in llm_metrics.snapshot().items() if key != "sessions"}
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
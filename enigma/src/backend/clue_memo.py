@@ -0,0 +1,95 @@
+import threading
+
+# Process-wide counters across every game, for the metrics endpoint
+totals = {"hits": 0, "misses": 0, "regenerations": 0}
+totals_lock = threading.Lock()
+
+
+def _count(counter):
+    with totals_lock:
+        totals[counter] += 1
+
+
+class ClueMemo:
+    # Remembers generated clue text per game, keyed on everything that goes into the prompt, so
+    # repeat examines and conversations are free and consistent. With regenerate_after=N a clue is
+    # served N times and then generated fresh. An optional shared WorldCache (scope = theme) lets
+    # games that share a world reuse each other's clues.
+    def __init__(self, regenerate_after=None, shared=None, scope=""):
+        self.regenerate_after = regenerate_after
+        self.shared = shared
+        self.scope = scope
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        del state["shared"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.shared = None
+
+    def _shared_key(self, key):
+        return "clue|" + "|".join(str(part) for part in key)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            expired = entry is not None and self.regenerate_after is not None and entry[1] >= self.regenerate_after
+            if expired:
+                del self.entries[key]
+                entry = None
+                _count("regenerations")
+            if entry is None and not expired and self.shared is not None:
+                text = self.shared.get(self.scope, self._shared_key(key))
+                if text is not None:
+                    entry = self.entries[key] = [text, 0]
+            if entry is None:
+                self.misses += 1
+                _count("misses")
+                return None
+            entry[1] += 1
+            self.hits += 1
+            _count("hits")
+            return entry[0]
+
+    # Whether get() would answer without a new call, for deciding what to prefetch. Neither counts
+    # as a lookup nor as a view; text found in the shared store is kept for the get() that follows.
+    def has(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                return self.regenerate_after is None or entry[1] < self.regenerate_after
+            if self.shared is None:
+                return False
+            text = self.shared.get(self.scope, self._shared_key(key))
+            if text is not None:
+                self.entries[key] = [text, 0]
+            return text is not None
+
+    def put(self, key, text):
+        with self.lock:
+            # The view that generated the text counts as the first one
+            self.entries[key] = [text, 1]
+        if self.shared is not None:
+            self.shared.put(self.scope, self._shared_key(key), text)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
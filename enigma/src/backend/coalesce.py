@@ -0,0 +1,28 @@
+import asyncio
+
+
+class Coalescer:
+    # Runs one coroutine per key at a time. Callers asking for a key that is already in flight await
+    # the same result instead of starting their own, and a caller that gives up does not cancel it for
+    # the others. Meant for a single event loop.
+    def __init__(self):
+        self.inflight = {}
+        self.leaders = 0
+        self.joined = 0
+
+    def busy(self, key):
+        return key in self.inflight
+
+    async def run(self, key, factory):
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self.inflight.pop(key) if self.inflight.get(key) is done else None)
+            self.leaders += 1
+        else:
+            self.joined += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"inflight": len(self.inflight), "leaders": self.leaders, "joined": self.joined}
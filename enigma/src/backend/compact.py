@@ -0,0 +1,201 @@
+import struct
+from array import array
+
+from clue_memo import ClueMemo
+from engine import GameState
+from exploration import IcosahedronGraph, Room
+from topology import shared as shared_topology
+
+# Binary save format for a GameState. Every name is stored once in a string table and referenced by
+# index; where NPCs and items are, which rooms are visited and what the player carries are small
+# integer arrays and a bitset. Restoring rebuilds the Room objects without any LLM calls.
+MAGIC = b"EGS"
+VERSION = 3
+# Version 2 stored room and item indexes as int16, which capped worlds at 32767 rooms
+VERSIONS = {2: "h", 3: "i"}
+NONE = -1
+CARRIED = -1
+_HEADER = struct.Struct("<3sB")
+_INT = struct.Struct("<i")
+
+
+class StringTable:
+    def __init__(self, strings=None):
+        self.strings = strings if strings is not None else []
+        self.ids = {string: i for i, string in enumerate(self.strings)}
+
+    def intern(self, string):
+        if string is None:
+            return NONE
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def lookup(self, string_id):
+        return None if string_id == NONE else self.strings[string_id]
+
+
+class _Writer:
+    def __init__(self):
+        self.parts = []
+
+    def int(self, value):
+        self.parts.append(_INT.pack(value))
+
+    def ints(self, values, typecode="i"):
+        data = array(typecode, values).tobytes()
+        self.int(len(data))
+        self.parts.append(data)
+
+    def bytes(self, data):
+        self.int(len(data))
+        self.parts.append(data)
+
+
+class _Reader:
+    def __init__(self, data, offset=0):
+        self.data = memoryview(data)
+        self.offset = offset
+
+    def int(self):
+        value = _INT.unpack_from(self.data, self.offset)[0]
+        self.offset += _INT.size
+        return value
+
+    def bytes(self):
+        size = self.int()
+        data = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def ints(self, typecode="i"):
+        values = array(typecode)
+        values.frombytes(self.bytes())
+        return values
+
+
+def _locations(names, rooms, attribute):
+    # Index of the room holding each name; repeated names are matched to rooms in order
+    where = [CARRIED] * len(names)
+    slots = {}
+    for i, name in enumerate(names):
+        slots.setdefault(name, []).append(i)
+    for room_index, room in enumerate(rooms):
+        for name in getattr(room, attribute):
+            where[slots[name].pop(0)] = room_index
+    return where, slots
+
+
+def dumps(state):
+    graph = state.graph
+    strings = StringTable()
+    body = _Writer()
+    topology = graph.topology
+
+    npc_rooms, _ = _locations(graph.npcs, graph.rooms, "npcs")
+    item_rooms, unplaced = _locations(graph.items, graph.rooms, "items")
+    # Whatever is not in a room is carried, in the order it was picked up
+    inventory = [unplaced[item].pop(0) for item in state.inventory]
+    visited = bytearray((len(graph.rooms) + 7) // 8)
+    for i, room in enumerate(graph.rooms):
+        if room.visited:
+            visited[i // 8] |= 1 << (i % 8)
+
+    for value in (graph.theme, graph.name, graph.intro, topology.name, graph.murderer, graph.report_item,
+                  state.pending, state.murderer_guess, graph.clues.scope, graph.world_id):
+        body.int(strings.intern(value))
+    body.int(1 if graph.lazy else 0)
+    body.int(topology.size)
+    body.ints([end for edge in topology.edges for end in edge])
+    body.ints([strings.intern(room.description) for room in graph.rooms])
+    body.ints([strings.intern(room.details) for room in graph.rooms])
+    body.ints([strings.intern(npc) for npc in graph.npcs])
+    body.ints([strings.intern(item) for item in graph.items])
+    body.ints(npc_rooms)
+    body.ints(item_rooms)
+    body.ints(inventory)
+    body.bytes(bytes(visited))
+    body.int(graph.crime_scene)
+    body.int(state.room_index)
+    body.int(1 if state.finished else 0)
+
+    clues = graph.clues
+    body.int(NONE if clues.regenerate_after is None else clues.regenerate_after)
+    body.int(clues.hits)
+    body.int(clues.misses)
+    body.int(len(clues.entries))
+    for key, (text, views) in clues.entries.items():
+        body.ints([strings.intern(part) for part in key])
+        body.int(strings.intern(text))
+        body.int(views)
+
+    head = _Writer()
+    head.int(len(strings.strings))
+    for string in strings.strings:
+        head.bytes(string.encode("utf-8"))
+    return _HEADER.pack(MAGIC, VERSION) + b"".join(head.parts) + b"".join(body.parts)
+
+
+def loads(data):
+    magic, version = _HEADER.unpack_from(data)
+    if magic != MAGIC or version not in VERSIONS:
+        raise ValueError(f"Not a version {VERSION} game state")
+    index = VERSIONS[version]
+    reader = _Reader(data, _HEADER.size)
+    strings = StringTable([bytes(reader.bytes()).decode("utf-8") for _ in range(reader.int())])
+    text = strings.lookup
+
+    theme, name, intro, shape, murderer, report_item, pending, murderer_guess, scope, world_id = (
+        text(reader.int()) for _ in range(10))
+    lazy = bool(reader.int())
+    size = reader.int()
+    ends = reader.ints()
+    topology = shared_topology(size, ends, shape)
+    room_names = [text(i) for i in reader.ints()]
+    room_details = [text(i) for i in reader.ints()]
+    npcs = [text(i) for i in reader.ints()]
+    items = [text(i) for i in reader.ints()]
+    npc_rooms = reader.ints(index)
+    item_rooms = reader.ints(index)
+    inventory = [items[i] for i in reader.ints(index)]
+    visited = bytes(reader.bytes())
+    crime_scene = reader.int()
+    room_index = reader.int()
+    finished = bool(reader.int())
+
+    regenerate_after = reader.int()
+    clues = ClueMemo(None if regenerate_after == NONE else regenerate_after, None, scope)
+    clues.hits = reader.int()
+    clues.misses = reader.int()
+    for _ in range(reader.int()):
+        key = tuple(text(i) for i in reader.ints())
+        clues.entries[key] = [text(reader.int()), reader.int()]
+
+    rooms = []
+    for i, description in enumerate(room_names):
+        room = Room.__new__(Room)
+        room.__setstate__({
+            "description": description, "details": room_details[i], "connections": [], "npcs": [], "items": [],
+            "is_crime_scene": i == crime_scene, "report_item": report_item, "murderer": murderer,
+            "visited": bool(visited[i // 8] & (1 << (i % 8))), "clues": clues,
+        })
+        rooms.append(room)
+    for a, b in topology.edges:
+        rooms[a].connect(rooms[b])
+    for npc, room_index_of in zip(npcs, npc_rooms):
+        if room_index_of != CARRIED:
+            rooms[room_index_of].add_npc(npc)
+    for item, room_index_of in zip(items, item_rooms):
+        if room_index_of != CARRIED:
+            rooms[room_index_of].add_item(item)
+
+    graph = IcosahedronGraph.__new__(IcosahedronGraph)
+    graph.__setstate__({
+        "theme": theme, "name": name, "lazy": lazy, "topology": topology,
+        "counts": {"rooms": 0 if lazy else size, "npcs": len(npcs), "items": len(items)},
+        "intro": intro, "world_id": world_id, "npcs": npcs, "items": items, "clues": clues, "rooms": rooms,
+        "crime_scene": crime_scene, "murderer": murderer, "report_item": report_item,
+    })
+    return GameState(graph, room_index, inventory, pending, murderer_guess, finished)
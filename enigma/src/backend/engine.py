@@ -0,0 +1,300 @@
+import asyncio
+import copy
+import re
+
+from resolve import parse_command
+
+ACTIONS = [
+    "1. Move to another room",
+    "2. Examine items",
+    "3. Take an item",
+    "4. View inventory",
+    "5. Interact with an NPC",
+    "6. Report the crime",
+    "q. Quit",
+]
+MENU_KEYS = {"1", "2", "3", "4", "5", "6", "q"}
+
+
+class GameState:
+    # Everything a turn needs: the world, where the player is, what they carry and which
+    # question the game is waiting on. Rooms are referenced by index so the state pickles small.
+    __slots__ = ("graph", "room_index", "inventory", "pending", "murderer_guess", "finished")
+
+    def __init__(self, graph, room_index=0, inventory=None, pending=None, murderer_guess=None, finished=False):
+        self.graph = graph
+        self.room_index = room_index
+        self.inventory = inventory if inventory is not None else []
+        self.pending = pending
+        self.murderer_guess = murderer_guess
+        self.finished = finished
+
+    @property
+    def room(self):
+        return self.graph.rooms[self.room_index]
+
+
+class Narration:
+    # LLM text that is only produced once the response is rendered, either all at once or streamed.
+    # atext(llm), when given, produces it with an async backend (see astart/astep).
+    def __init__(self, text, stream, atext=None):
+        self.text = text
+        self.stream = stream
+        self.atext = atext
+
+
+def response(messages, prompt="Choose an action: ", options=None, done=False):
+    return {"messages": messages, "prompt": prompt, "options": options if options is not None else ACTIONS, "done": done}
+
+
+def describe_room(room):
+    lines = ["You are currently in the " + room.description]
+    if room.details:
+        lines.append(room.details)
+    if room.is_crime_scene:
+        lines.append("This room is a CRIME SCENE.")
+    if room.npcs:
+        lines.append("NPCs in the room:")
+        lines.extend(f" - {npc}" for npc in room.npcs)
+    if room.items:
+        lines.append("Items in the room:")
+        lines.extend(f" - {item}" for item in room.items)
+    return lines
+
+
+def _menu(state, messages):
+    return response(messages + [""] + describe_room(state.room) + ["", "Available actions:"] + ACTIONS)
+
+
+def _render(response):
+    response["messages"] = [message.text() if isinstance(message, Narration) else message for message in response["messages"]]
+    return response
+
+
+async def _arender(response, llm):
+    messages = []
+    for message in response["messages"]:
+        if isinstance(message, Narration):
+            message = await message.atext(llm) if message.atext else await asyncio.to_thread(message.text)
+        messages.append(message)
+    response["messages"] = messages
+    return response
+
+
+async def _lines(lines):
+    return "\n".join(await lines)
+
+
+def _stream(response):
+    for message in response["messages"]:
+        if isinstance(message, Narration):
+            yield from message.stream()
+            yield "\n"
+        else:
+            yield message + "\n"
+    if response["prompt"]:
+        yield response["prompt"]
+
+
+def _start(graph):
+    state = GameState(graph)
+    graph.visit(state.room_index)
+    graph.speculate(state.room_index)
+    return state, _menu(state, [Narration(graph._generate_intro, graph.stream_intro, graph.agenerate_intro)])
+
+
+def start(graph):
+    state, response = _start(graph)
+    return state, _render(response)
+
+
+# Same as start() but the response is a generator of text chunks for streaming to the player
+def stream_start(graph):
+    state, response = _start(graph)
+    return state, _stream(response)
+
+
+# Async versions of start() and step() for the ASGI app: narration goes through the async backend
+# llm, and the turn itself (which may fill in a lazy room) runs on a worker thread
+async def astart(graph, llm):
+    state, response = await asyncio.to_thread(_start, graph)
+    return state, await _arender(response, llm)
+
+
+async def astep(state, command, llm):
+    state, response = await asyncio.to_thread(_apply, state, command)
+    return state, await _arender(response, llm)
+
+
+# Applies one player command and returns the next state with a structured response.
+# The world itself (rooms, items) is shared and updated in place; the per-player fields are copied.
+def step(state, command):
+    state, response = _apply(state, command)
+    return state, _render(response)
+
+
+# Same as step() but the response is a generator of text chunks. The returned state is already
+# final, but narration still writes clue text and the intro into its graph while it streams, so
+# save it again once the chunks are exhausted.
+def stream_step(state, command):
+    state, response = _apply(state, command)
+    return state, _stream(response)
+
+
+def _apply(state, command):
+    state = copy.copy(state)
+    state.inventory = list(state.inventory)
+    command = (command or "").strip()
+    if state.finished:
+        return state, response(["The game is over. Start a new game to play again."], prompt="", options=[], done=True)
+    handler = PENDING_HANDLERS.get(state.pending, _choose_action)
+    state.pending = None
+    state, result = handler(state, command)
+    # Start on what the player will probably ask for next while they read this response
+    if state.finished:
+        state.graph.stop_speculating()
+    else:
+        state.graph.speculate(state.room_index)
+    return state, result
+
+
+# Free text such as "go to the library", "grab the silvr knife", "talk to ada" or "accuse Ada with
+# the knife" is understood locally; a bare verb works like its menu number
+def _choose_action(state, command):
+    if command not in MENU_KEYS:
+        action, rest = parse_command(command)
+        if action in FREE_TEXT_HANDLERS and rest:
+            return FREE_TEXT_HANDLERS[action](state, rest)
+        command = action or command
+    room = state.room
+    if command == "q":
+        state.finished = True
+        return state, response(["Thanks for playing."], prompt="", options=[], done=True)
+    if command == "1":
+        options = [f"{i + 1}. {other.description if other.visited else 'Unexplored Room'}" for i, other in enumerate(room.connections)]
+        state.pending = "move"
+        return state, response(["Which room do you want to go to next?", "Rooms:"] + options, "Choose a room to move to: ", options)
+    if command == "2":
+        return state, _menu(state, [Narration(lambda: "\n".join(room.examine_items()), room.stream_examine_items,
+                                              lambda llm: _lines(room.aexamine_items(llm)))])
+    if command == "3":
+        state.pending = "take"
+        return state, response([], "Enter the name of the item you want to take: ", list(room.items))
+    if command == "4":
+        if not state.inventory:
+            return state, _menu(state, ["Your inventory is empty."])
+        return state, _menu(state, ["Inventory:"] + [f" - {item}" for item in state.inventory])
+    if command == "5":
+        if not room.npcs:
+            return state, _menu(state, ["There are no NPCs to interact with in this room."])
+        options = [f"{i + 1}. {npc}" for i, npc in enumerate(room.npcs)]
+        state.pending = "interact"
+        return state, response(["Which NPC do you want to interact with?"] + options, "Choose an NPC to interact with: ", options)
+    if command == "6":
+        state.pending = "report_murderer"
+        return state, response([], "Enter the name of the murderer: ", list(state.graph.npcs))
+    return state, _menu(state, ["Invalid action. Please try again."])
+
+
+def _did_you_mean(matches):
+    return "Did you mean " + " or ".join(matches[:3]) + "?"
+
+
+# A number from the list, or a name from `names` (None for entries that cannot be named)
+def _choose_index(command, choices, graph=None, names=None):
+    try:
+        index = int(command) - 1
+    except ValueError:
+        if names is None:
+            return None, "Invalid input. Please enter a number."
+        matches = graph.name_index().matches(command, [name for name in names if name])
+        if len(matches) == 1:
+            return names.index(matches[0]), None
+        if matches:
+            return None, _did_you_mean(matches)
+        return None, "Invalid input. Please enter a number or a name."
+    if 0 <= index < len(choices):
+        return index, None
+    return None, "Invalid choice. Try again."
+
+
+# The one name in candidates that text refers to; otherwise None and what to tell the player
+def _resolve(state, text, candidates):
+    matches = state.graph.name_index().matches(text, candidates)
+    if len(matches) == 1:
+        return matches[0], None
+    return None, _did_you_mean(matches) if matches else None
+
+
+def _move(state, command):
+    connections = state.room.connections
+    index, error = _choose_index(command, connections, state.graph, [other.description if other.visited else None for other in connections])
+    if error:
+        return state, _menu(state, [error])
+    state.room_index = state.graph.topology.neighbours(state.room_index)[index]
+    state.graph.visit(state.room_index)
+    return state, _menu(state, [])
+
+
+def _take(state, command):
+    item, error = _resolve(state, command, state.room.items)
+    if item is None:
+        return state, _menu(state, [error or f"No item named {command} found in this room."])
+    state.room.take_item(item)
+    state.inventory.append(item)
+    return state, _menu(state, [f"You take the {item}."])
+
+
+def _interact(state, command):
+    index, error = _choose_index(command, state.room.npcs, state.graph, state.room.npcs)
+    if error:
+        return state, _menu(state, [error])
+    npc = state.room.npcs[index]
+    graph = state.graph
+    return state, _menu(state, [Narration(lambda: graph._interact_with_npc(npc), lambda: graph.stream_interaction(npc),
+                                          lambda llm: graph.ainteract_with_npc(npc, llm))])
+
+
+def _report_murderer(state, command):
+    state.pending = "report_item"
+    state.murderer_guess = _resolve(state, command, state.graph.npcs)[0] or command
+    return state, response([], "Enter the name of the item you think is the murder weapon: ", list(state.inventory))
+
+
+def _report_item(state, command):
+    graph = state.graph
+    murderer_guess, state.murderer_guess = state.murderer_guess, None
+    item = _resolve(state, command, state.inventory)[0]
+    if murderer_guess == graph.murderer and item is not None:
+        state.finished = True
+        return state, response([
+            "You correctly identified the murderer and the murder weapon!",
+            f"The murderer is {graph.murderer} and the murder weapon is {item}!",
+        ], prompt="", options=[], done=True)
+    return state, _menu(state, ["Incorrect guess. Either the murderer or the item is wrong. Try again."])
+
+
+# "accuse Ada" asks for the weapon next; "accuse Ada with the knife" reports both at once
+def _accuse(state, command):
+    murderer, _, item = (re.split(r"\s+(with|using)\s+", command, maxsplit=1, flags=re.IGNORECASE) + ["", ""])[:3]
+    state, result = _report_murderer(state, murderer)
+    if not item:
+        return state, result
+    state.pending = None
+    return _report_item(state, item)
+
+
+FREE_TEXT_HANDLERS = {
+    "1": _move,
+    "3": _take,
+    "5": _interact,
+    "6": _accuse,
+}
+
+PENDING_HANDLERS = {
+    "move": _move,
+    "take": _take,
+    "interact": _interact,
+    "report_murderer": _report_murderer,
+    "report_item": _report_item,
+}
@@ -1,16 +1,59 @@
+import asyncio
+import json
 import random
-from openai import OpenAI
-import openai
-from dotenv import load_dotenv
-import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+import engine
+from clue_memo import ClueMemo
+from llm import as_backend, default_backend
+from metrics import llm_metrics, submit
+from prefetch import prefetcher
+from resolve import NameIndex
+from topology import icosahedron
 
-load_dotenv()
-client = OpenAI(api_key = os.environ.get("MY_API_KEY"),
-)
+def cached(site, value):
+    llm_metrics.record_cache(site, value is not None)
+    return value
+
+# Clue text from the game's memo, or from a speculative call started on an earlier turn
+def remembered(site, clues, key):
+    text = clues.get(key)
+    if text is None:
+        text = prefetcher.claim(("clue", clues.scope) + key, EXAMINE_TIMEOUT)
+        if text is not None:
+            clues.put(key, text)
+    return cached(site, text)
+
+async def aremembered(site, clues, key):
+    text = clues.get(key)
+    if text is None:
+        text = await prefetcher.aclaim(("clue", clues.scope) + key, EXAMINE_TIMEOUT)
+        if text is not None:
+            clues.put(key, text)
+    return cached(site, text)
+
+WORLD_COUNTS = {"rooms": 12, "npcs": 5, "items": 8}
+# Cached intros are stored with the player name swapped out so every player of a theme can share them
+INVESTIGATOR_PLACEHOLDER = "{investigator}"
+# Item descriptions in a room are requested in parallel; a slow or failed one only affects its own item
+EXAMINE_WORKERS = 4
+EXAMINE_TIMEOUT = 20
+# Lazy worlds fill in a room (name, description, item and NPC clues) with one call the first time it
+# is entered; the rooms next door are prefetched speculatively (see speculate)
+ROOM_TIMEOUT = 30
 
 class Room:
-    def __init__(self, description, report_item=None, murderer=None):
+    # Fixed attributes keep the per-room footprint small when thousands of games are in memory
+    __slots__ = ("description", "details", "llm", "connections", "npcs", "items", "is_crime_scene",
+                 "report_item", "murderer", "visited", "clues")
+
+    # description is the room's name (None until a lazy world fills it in); details is the longer
+    # text shown on entering, only generated for lazy worlds
+    def __init__(self, description, report_item=None, murderer=None, llm=None):
         self.description = description
+        self.details = None
+        self.llm = as_backend(llm)
         self.connections = []
         self.npcs = []
         self.items = []
@@ -18,6 +61,16 @@ class Room:
         self.report_item = report_item
         self.murderer = murderer
         self.visited = False  # Add visited attribute
+        self.clues = None
+
+    # The LLM backend is not part of the saved game; a restored room talks to the default backend
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot != "llm"}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self.llm = default_backend()
 
     def connect(self, other_room):
         self.connections.append(other_room)
@@ -32,76 +85,430 @@ class Room:
     def set_crime_scene(self):
         self.is_crime_scene = True
 
-    def examine_items(self):
+    def _examine_messages(self, item):
+        return [
+            {"role": "system", "content": "You are a player in a murder mystery game. However, do not mention you are part of a game."},
+            {"role": "user", "content": f"Describe the appearance and any evidence that can pinpoint the murderer for the item: {item}. Try to relate the description to the murder item: {self.report_item} and the murderer: {self.murderer}. Do not reveal the murderer or the murder item. Be subtle about the murder item and do not directly name if the {item} that you are examining is not the murder item. Make it at most one to two sentences."}
+        ]
+
+    def _clue_key(self, item):
+        return ("examine", item, self.report_item, self.murderer)
+
+    def _remembered(self, item):
+        return remembered("examine", self.clues, self._clue_key(item)) if self.clues is not None else None
+
+    def _remember(self, item, text):
+        if self.clues is not None:
+            self.clues.put(self._clue_key(item), text)
+        return text
+
+    def _describe_item(self, item, timeout):
+        text = self._remembered(item)
+        if text is not None:
+            return text
+        return self._remember(item, self.llm.complete("examine", self._examine_messages(item), timeout=timeout))
+
+    def _describe_items(self, items, timeout):
+        executor = ThreadPoolExecutor(max_workers=max(1, min(EXAMINE_WORKERS, len(items))))
+        futures = [submit(executor, self._describe_item, item, timeout) for item in items]
+        executor.shutdown(wait=False)
+        return futures
+
+    def _item_result(self, item, future, deadline):
+        try:
+            return future.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception:
+            future.cancel()
+            return f"You can't make out anything more about the {item} right now."
+
+    def examine_items(self, timeout=EXAMINE_TIMEOUT):
+        if not self.items:
+            return ["There are no items to examine in this room."]
+        items = list(self.items)
+        deadline = time.monotonic() + timeout
+        futures = self._describe_items(items, timeout)
+        lines = []
+        for item, future in zip(items, futures):
+            lines.append(f"You examine the {item}.")
+            lines.append(self._item_result(item, future, deadline))
+        return lines
+
+    # The first item streams live while the rest are fetched in the background and follow in room order
+    def stream_examine_items(self, timeout=EXAMINE_TIMEOUT):
         if not self.items:
-            print("There are no items to examine in this room.")
+            yield "There are no items to examine in this room."
+            return
+        items = list(self.items)
+        deadline = time.monotonic() + timeout
+        futures = self._describe_items(items[1:], timeout) if len(items) > 1 else []
+        yield f"You examine the {items[0]}.\n"
+        text = self._remembered(items[0])
+        if text is not None:
+            yield text
         else:
-            for item in self.items:
-                print(f"You examine the {item}.")
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are a player in a murder mystery game. However, do not mention you are part of a game."},
-                        {"role": "user", "content": f"Describe the appearance and any evidence that can pinpoint the murderer for the item: {item}. Try to relate the description to the murder item: {self.report_item} and the murderer: {self.murderer}. Do not reveal the murderer or the murder item. Be subtle about the murder item and do not directly name if the {item} that you are examining is not the murder item. Make it at most one to two sentences."}
-                    ]
-                )
-                print(response.choices[0].message.content)
+            chunks = []
+            try:
+                for chunk in self.llm.stream("examine", self._examine_messages(items[0])):
+                    chunks.append(chunk)
+                    yield chunk
+                self._remember(items[0], "".join(chunks))
+            except Exception:
+                yield f"You can't make out anything more about the {items[0]} right now."
+        for item, future in zip(items[1:], futures):
+            yield f"\nYou examine the {item}.\n"
+            yield self._item_result(item, future, deadline)
+
+    # Async version of examine_items for the ASGI app; llm is an async backend
+    async def aexamine_items(self, llm, timeout=EXAMINE_TIMEOUT):
+        if not self.items:
+            return ["There are no items to examine in this room."]
+        items = list(self.items)
+        texts = await asyncio.gather(*(self._adescribe_item(item, llm, timeout) for item in items))
+        lines = []
+        for item, text in zip(items, texts):
+            lines.append(f"You examine the {item}.")
+            lines.append(text)
+        return lines
+
+    async def _adescribe_item(self, item, llm, timeout):
+        try:
+            text = await aremembered("examine", self.clues, self._clue_key(item)) if self.clues is not None else None
+            if text is None:
+                text = await asyncio.wait_for(llm.complete("examine", self._examine_messages(item), timeout=timeout), timeout)
+                if self.clues is not None:
+                    self.clues.put(self._clue_key(item), text)
+            return text
+        except Exception:
+            return f"You can't make out anything more about the {item} right now."
 
     def take_item(self, item_name):
         for item in self.items:
             if item == item_name:
                 self.items.remove(item)
-                print(f"You take the {item}.")
                 return item
-        print(f"No item named {item_name} found in this room.")
         return None
 
 class IcosahedronGraph:
-    def __init__(self, theme):
+    # Room, NPC and item names are requested at the same time; max_workers=1 keeps the old serial order.
+    # batched=True asks for the whole world and the intro in a single JSON response instead.
+    # An optional WorldCache serves names and intros for themes that have been generated before.
+    # Clue text is remembered per game (see ClueMemo); clue_store shares it between games of a theme.
+    # topology lays out the house; it defaults to the 12-room icosahedron (see topology.py for others).
+    # lazy=True only names the NPCs and items up front; each room is generated when first visited.
+    def __init__(self, theme, name="Player", llm=None, max_workers=3, batched=False, cache=None,
+                 clue_regenerate_after=None, clue_store=None, topology=None, lazy=False):
+        self._configure(theme, name, llm, cache, topology, lazy)
+        if batched:
+            self._use_world(self._generate_world(), clue_regenerate_after, clue_store)
+        else:
+            room_names, self.npcs, self.items = self._generate_all_names(max_workers)
+            self._lay_out(room_names, clue_regenerate_after, clue_store)
+
+    # Same as IcosahedronGraph(theme, name, batched=True, ...), but the world and intro are requested
+    # through the async backend allm. llm stays the threaded backend later turns use.
+    @classmethod
+    async def abuild(cls, theme, name, allm, llm=None, cache=None, clue_regenerate_after=None, clue_store=None,
+                     topology=None, lazy=False):
+        graph = cls.__new__(cls)
+        graph._configure(theme, name, llm, cache, topology, lazy)
+        graph._use_world(await graph._agenerate_world(allm), clue_regenerate_after, clue_store)
+        return graph
+
+    def _configure(self, theme, name, llm, cache, topology, lazy):
         self.theme = theme
         self.name = name
-        self.rooms = [Room(name) for name in self._generate_names("room names", 12)]
+        self.lazy = lazy
+        self.topology = topology or icosahedron()
+        self.counts = dict(WORLD_COUNTS, rooms=0 if lazy else self.topology.size)
+        self.llm = as_backend(llm)
+        self.cache = cache
+        self.index = None
+        self.intro = None
+
+    def _use_world(self, world, clue_regenerate_after, clue_store):
+        self.npcs, self.items, self.intro = world["npcs"], world["items"], world["intro"]
+        self._lay_out(world["rooms"], clue_regenerate_after, clue_store)
+
+    def _lay_out(self, room_names, clue_regenerate_after, clue_store):
+        room_names = [None] * self.topology.size if self.lazy else self._fit_room_names(room_names)
+        self.clues = ClueMemo(clue_regenerate_after, clue_store, self.theme)
+        self.rooms = [Room(room_name, llm=self.llm) for room_name in room_names]
+        for room in self.rooms:
+            room.clues = self.clues
         self._connect_rooms()
-        self.npcs = self._generate_names("NPC names", 5)
-        self.items = self._generate_names("item names", 8)
         self._add_npcs_and_items()
+        self.randomize_crime()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["llm"]
+        del state["cache"]
+        state.pop("index", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.llm = default_backend()
+        self.cache = None
+        self.index = None
+
+    # Fuzzy lookup over every name in the game, for understanding what players type. Rebuilt when
+    # the names change, which only happens as lazy rooms are filled in.
+    def name_index(self):
+        names = tuple(self.npcs) + tuple(self.items) + tuple(room.description for room in self.rooms if room.description)
+        if self.index is None or self.index.source != names:
+            self.index = NameIndex(names)
+        return self.index
+
+    # Reconnects the runtime helpers that are not saved with a session
+    def attach(self, llm=None, cache=None, clue_store=None):
+        if llm is not None:
+            self.llm = as_backend(llm)
+            for room in self.rooms:
+                room.llm = self.llm
+        self.cache = cache
+        self.clues.shared = clue_store
+
+    # Picks a new crime scene, murderer and weapon without regenerating the world
+    def randomize_crime(self):
+        self.clues.clear()
+        # Lazy rooms are written around the crime, so they are generated again for the new one
+        self.world_id = secrets.token_hex(8)
+        for room in self.rooms:
+            room.is_crime_scene = False
+            if self.lazy:
+                room.description = room.details = None
         self._set_random_crime_scene()
+        self.topology.distances_from(self.crime_scene)
         self.murderer = self._set_random_murderer()
         self.report_item = random.choice(self._get_all_items())
         self._assign_crime_info()
 
+    # Marks a room as entered; lazy worlds fill it in first
+    def visit(self, room_index):
+        room = self.rooms[room_index]
+        if self.lazy:
+            self._fill_room(room_index)
+        room.visited = True
+        return room
+
+    # Starts the calls the player's next action in this room most likely needs: clues for the items
+    # and NPCs here that neither this game nor the shared clue store has yet, then (for lazy worlds)
+    # the rooms next door. Anything speculated for the room the player left is cancelled. The jobs
+    # only read the graph; results are claimed when needed.
+    def speculate(self, room_index):
+        room = self.rooms[room_index]
+        jobs = []
+        for item in room.items:
+            key = room._clue_key(item)
+            if not self.clues.has(key):
+                jobs.append((("clue", self.clues.scope) + key, self.llm.complete, "examine", room._examine_messages(item)))
+        for npc in room.npcs:
+            key = self._npc_key(npc)
+            if not self.clues.has(key):
+                jobs.append((("clue", self.clues.scope) + key, self.llm.complete, "npc", self._npc_messages(npc)))
+        if self.lazy:
+            for other in self.topology.neighbours(room_index):
+                if self.rooms[other].description is None:
+                    jobs.append((("room", self.world_id, other), self._generate_room, other))
+        prefetcher.focus(self.world_id, jobs)
+
+    def stop_speculating(self):
+        prefetcher.forget(self.world_id)
+
+    def _fill_room(self, room_index):
+        if self.rooms[room_index].description is not None:
+            return
+        content = prefetcher.claim(("room", self.world_id, room_index), ROOM_TIMEOUT)
+        if content is None:
+            try:
+                content = self._generate_room(room_index)
+            except Exception:
+                content = {}
+        self._apply_room(room_index, content)
+
+    def _room_messages(self, room_index):
+        room = self.rooms[room_index]
+        scene = " This is the room where John Doe's body was found." if room.is_crime_scene else ""
+        taken = [other.description for other in self.rooms if other.description]
+        prompt = f"Describe one room of the house.{scene} NPCs in the room: {json.dumps(room.npcs)}. Items in the room: {json.dumps(room.items)}.\n"
+        prompt += "Return a JSON object with these keys:\n"
+        prompt += '"name": a short room name that is different from the item names'
+        prompt += (" and from these rooms: " + ", ".join(taken) + ".\n") if taken else ".\n"
+        prompt += '"description": one to two sentences describing the room in the second person point of view.\n'
+        prompt += f'"items": an object mapping each item name to one or two sentences on its appearance and any evidence that can pinpoint the murderer {self.murderer} or the murder item {self.report_item}, without revealing either.\n'
+        prompt += '"npcs": an object mapping each NPC name to a one or two sentence interaction in the second person point of view that subtly hints at the murderer and the murder item.'
+        return [
+            {"role": "system", "content": f"You build rooms for a murder mystery game based on the theme '{self.theme}'. Reply with a single JSON object only."},
+            {"role": "user", "content": prompt}
+        ]
+
+    # Runs on prefetch threads, so it only reads the graph; _apply_room writes the result
+    def _generate_room(self, room_index):
+        content = json.loads(self.llm.complete("room", self._room_messages(room_index), json_mode=True, timeout=ROOM_TIMEOUT))
+        return content if isinstance(content, dict) else {}
+
+    def _apply_room(self, room_index, content):
+        room = self.rooms[room_index]
+        name = content.get("name")
+        name = name.strip() if isinstance(name, str) and name.strip() else f"Room {room_index + 1}"
+        taken = {other.description for other in self.rooms if other.description}
+        while name in taken:
+            name += "'"
+        room.description = name
+        if isinstance(content.get("description"), str):
+            room.details = content["description"].strip()
+        # Item and NPC texts go into the clue memo, so examining and talking are free afterwards
+        for part, names, key in (("items", room.items, room._clue_key), ("npcs", room.npcs, self._npc_key)):
+            texts = content.get(part)
+            if not isinstance(texts, dict):
+                continue
+            for entity in names:
+                if isinstance(texts.get(entity), str) and texts[entity].strip():
+                    self.clues.put(key(entity), texts[entity].strip())
+
+    def set_investigator(self, name):
+        if self.intro:
+            self.intro = self.intro.replace(self.name, name) if self.name else self.intro
+        self.name = name
+
     def _assign_crime_info(self):
         for room in self.rooms:
             room.report_item = self.report_item
             room.murderer = self.murderer
 
+    def _generate_all_names(self, max_workers):
+        requests = [("room names", self.counts["rooms"]), ("NPC names", self.counts["npcs"]), ("item names", self.counts["items"])]
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [submit(executor, self._generate_names, category, count) for category, count in requests]
+            return [future.result() for future in futures]
+
+    def _generate_world(self, attempts=3):
+        world = self._cached_world()
+        if world is not None:
+            return world
+        world = {"rooms": [], "npcs": [], "items": [], "intro": ""}
+        for _ in range(attempts):
+            missing = self._missing_world_parts(world)
+            if not missing:
+                break
+            self._merge_reply(world, self.llm.complete("world", self._world_messages(world, missing), json_mode=True), missing)
+        return self._store_world(world)
+
+    async def _agenerate_world(self, llm, attempts=3):
+        world = self._cached_world()
+        if world is not None:
+            return world
+        world = {"rooms": [], "npcs": [], "items": [], "intro": ""}
+        for _ in range(attempts):
+            missing = self._missing_world_parts(world)
+            if not missing:
+                break
+            self._merge_reply(world, await llm.complete("world", self._world_messages(world, missing), json_mode=True), missing)
+        return self._store_world(world)
+
+    def _cached_world(self):
+        if self.cache is None:
+            return None
+        world = cached("world", self.cache.get(self.theme, self._world_category()))
+        if world is not None:
+            world["intro"] = world["intro"].replace(INVESTIGATOR_PLACEHOLDER, self.name)
+        return world
+
+    def _world_messages(self, world, missing):
+        return [
+            {"role": "system", "content": f"You build murder mystery games based on the theme '{self.theme}'. Reply with a single JSON object only."},
+            {"role": "user", "content": self._world_prompt(world, missing)}
+        ]
+
+    def _merge_reply(self, world, content, missing):
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return
+        if isinstance(data, dict):
+            self._merge_world(world, data, missing)
+
+    def _store_world(self, world):
+        missing = self._missing_world_parts(world)
+        if missing:
+            raise ValueError(f"Could not generate a complete world for theme '{self.theme}', missing: {missing}")
+        if self.cache is not None:
+            self.cache.put(self.theme, self._world_category(), dict(world, intro=self._intro_template(world["intro"])))
+        return world
+
+    def _world_category(self):
+        return f"world of {self.counts['rooms']} rooms"
+
+    def _shape(self):
+        return f"{self.topology.name} with {self.topology.size} rooms and {len(self.topology.edges)} different paths"
+
+    # The house needs exactly one name per room in the topology
+    def _fit_room_names(self, names):
+        names = names[:self.topology.size]
+        taken = set(names)
+        for i in range(len(names), self.topology.size):
+            name = f"Room {i + 1}"
+            while name in taken:
+                name += "'"
+            names.append(name)
+            taken.add(name)
+        return names
+
+    def _missing_world_parts(self, world):
+        missing = {key: count - len(world[key]) for key, count in self.counts.items() if len(world[key]) < count}
+        if not world["intro"]:
+            missing["intro"] = 1
+        return missing
+
+    def _world_prompt(self, world, missing):
+        parts = []
+        for key, count in missing.items():
+            if key == "intro":
+                parts.append(f'"intro": a one to two sentence introduction of the player, in the second person point of view, as an investigator named {self.name} for a themed house that just had a murder of a John Doe. Explain that the house is shaped like {self._shape()}.')
+            else:
+                parts.append(f'"{key}": a list of exactly {count} unique {key[:-1]} names.')
+        taken = world["rooms"] + world["npcs"] + world["items"]
+        prompt = "Return a JSON object with these keys:\n" + "\n".join(parts)
+        prompt += "\nMake room and item names different and distinct names to avoid confusion for player."
+        if taken:
+            prompt += " Do not reuse any of these names: " + ", ".join(taken) + "."
+        return prompt
+
+    def _merge_world(self, world, data, missing):
+        taken = {name.lower() for name in world["rooms"] + world["npcs"] + world["items"]}
+        for key in self.counts:
+            if key not in missing or not isinstance(data.get(key), list):
+                continue
+            for name in data[key]:
+                if not isinstance(name, str) or not name.strip() or name.strip().lower() in taken:
+                    continue
+                if len(world[key]) == self.counts[key]:
+                    break
+                world[key].append(name.strip())
+                taken.add(name.strip().lower())
+        if "intro" in missing and isinstance(data.get("intro"), str):
+            world["intro"] = data["intro"].strip()
+
     def _generate_names(self, category, count):
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": f"Generate {count} unique {category} based on the theme '{self.theme}'."},
-                {"role": "user", "content": "Make room and item names different and distinct names to avoid confusion for player."}
-                ]
-        )
-        raw_names = response.choices[0].message.content.strip().split('\n')
+        if not count:
+            return []
+        if self.cache is not None:
+            names = cached("names", self.cache.get(self.theme, f"{count} {category}"))
+            if names is not None:
+                return names
+        content = self.llm.complete("names", [
+            {"role": "system", "content": f"Generate {count} unique {category} based on the theme '{self.theme}'."},
+            {"role": "user", "content": "Make room and item names different and distinct names to avoid confusion for player."}
+        ])
+        raw_names = content.strip().split('\n')
         cleaned_names = [name.split('. ', 1)[-1].strip().strip("-").strip("'\"").strip() for name in raw_names if name.strip()]     
+        if self.cache is not None:
+            self.cache.put(self.theme, f"{count} {category}", cleaned_names)
         return cleaned_names
 
     def _connect_rooms(self):
-        connections = [
-            (0, 1), (0, 2), (0, 3), (0, 4), (0, 5), 
-            (1, 2), (1, 5), (1, 6), (1, 7), 
-            (2, 3), (2, 7), (2, 8), 
-            (3, 4), (3, 8), (3, 9), 
-            (4, 5), (4, 9), (4, 10), 
-            (5, 6), (5, 10), 
-            (6, 7), (6, 10), (6, 11), 
-            (7, 8), (7, 11), 
-            (8, 9), (8, 11), 
-            (9, 10), (9, 11), 
-            (10, 11)
-        ]
-        for a, b in connections:
+        for a, b in self.topology.edges:
             self.rooms[a].connect(self.rooms[b])
 
     def _add_npcs_and_items(self):
@@ -114,8 +521,12 @@ class IcosahedronGraph:
             room.add_item(item)
 
     def _set_random_crime_scene(self):
-        crime_scene_room = random.choice(self.rooms)
-        crime_scene_room.set_crime_scene()
+        self.crime_scene = random.randrange(len(self.rooms))
+        self.rooms[self.crime_scene].set_crime_scene()
+
+    # Constant time once the crime scene's distance row exists (built when the crime is picked)
+    def distance_to_crime_scene(self, room_index):
+        return self.topology.distance(room_index, self.crime_scene)
     
     def _set_random_murderer(self):
         return random.choice(self.npcs)
@@ -126,117 +537,100 @@ class IcosahedronGraph:
             items.extend(room.items)
         return items
 
+    def _npc_messages(self, npc):
+        return [
+            {"role": "system", "content": "In the second person point of view as the player, describe an NPC interaction in a murder mystery game."},
+            {"role": "user", "content": f"Describe the interaction with {npc} in one or two sentences and make it so that it clues the player into getting a little more info on the murderer {self.murderer} and the murder weapon{self.report_item}. Be very subtle with the messaging to the player, so as to not reveal the murderer and murder weapon"}
+        ]
+
+    def _npc_key(self, npc):
+        return ("npc", npc, self.murderer, self.report_item)
+
     def _interact_with_npc(self, npc):
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "In the second person point of view as the player, describe an NPC interaction in a murder mystery game."},
-                {"role": "user", "content": f"Describe the interaction with {npc} in one or two sentences and make it so that it clues the player into getting a little more info on the murderer {self.murderer} and the murder weapon{self.report_item}. Be very subtle with the messaging to the player, so as to not reveal the murderer and murder weapon"}
-            ]
-        )
-        print(response.choices[0].message.content)
-    
+        key = self._npc_key(npc)
+        text = remembered("npc", self.clues, key)
+        if text is not None:
+            return text
+        text = self.llm.complete("npc", self._npc_messages(npc))
+        self.clues.put(key, text)
+        return text
+
+    async def ainteract_with_npc(self, npc, llm):
+        key = self._npc_key(npc)
+        text = await aremembered("npc", self.clues, key)
+        if text is not None:
+            return text
+        text = await llm.complete("npc", self._npc_messages(npc))
+        self.clues.put(key, text)
+        return text
+
+    def stream_interaction(self, npc):
+        key = self._npc_key(npc)
+        text = remembered("npc", self.clues, key)
+        if text is not None:
+            yield text
+            return
+        chunks = []
+        for chunk in self.llm.stream("npc", self._npc_messages(npc)):
+            chunks.append(chunk)
+            yield chunk
+        self.clues.put(key, "".join(chunks))
+
+    def _intro_template(self, intro):
+        return intro.replace(self.name, INVESTIGATOR_PLACEHOLDER) if self.name else intro
+
+    def _intro_messages(self):
+        return [
+            {"role": "system", "content": "You are a player in a murder mystery game."},
+            {"role": "user", "content": f"Introduce the player in the second person point of view as an investigator named {self.name} for a themed house that just had a murder of a John Doe. The theme is {self.theme}. Explain that the house is shaped like {self._shape()}. Make it one to two sentences."}
+        ]
+
+    def _cached_intro(self):
+        if not self.intro and self.cache is not None:
+            intro = cached("intro", self.cache.get(self.theme, f"intro for {self._shape()}"))
+            if intro is not None:
+                self.intro = intro.replace(INVESTIGATOR_PLACEHOLDER, self.name)
+        return self.intro
+
+    def _store_intro(self, intro):
+        self.intro = intro
+        if self.cache is not None:
+            self.cache.put(self.theme, f"intro for {self._shape()}", self._intro_template(self.intro))
+        return self.intro
+
     def _generate_intro(self):
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a player in a murder mystery game."},
-                {"role": "user", "content": f"Introduce the player in the second person point of view as an investigator named {self.name} for a themed house that just had a murder of a John Doe. The theme is {self.theme}. Explain that the house is shaped like icosahedron with 12 rooms and 30 different paths. Make it one to two sentences."}
-            ]
-        )
-        print(response.choices[0].message.content)
+        if self._cached_intro():
+            return self.intro
+        return self._store_intro(self.llm.complete("intro", self._intro_messages()))
 
-    def navigate(self):
-        self._generate_intro()
-        current_room = self.rooms[0]
-        current_room.visited = True
-        inventory = []
+    async def agenerate_intro(self, llm):
+        if self._cached_intro():
+            return self.intro
+        return self._store_intro(await llm.complete("intro", self._intro_messages()))
 
+    def stream_intro(self):
+        if self._cached_intro():
+            yield self.intro
+            return
+        chunks = []
+        for chunk in self.llm.stream("intro", self._intro_messages()):
+            chunks.append(chunk)
+            yield chunk
+        self._store_intro("".join(chunks))
+
+    # Terminal adapter over the step engine that the web backend uses; narration is printed as it streams in
+    def navigate(self):
+        state, chunks = engine.stream_start(self)
         while True:
-            print("You are currently in the " + current_room.description)
-            
-            if current_room.is_crime_scene:
-                print("This room is a CRIME SCENE.")
-            
-            if current_room.npcs:
-                print("NPCs in the room:")
-                for npc in current_room.npcs:
-                    print(f" - {npc}")
-            if current_room.items:
-                print("Items in the room:")
-                for item in current_room.items:
-                    print(f" - {item}")
-
-            print("\nAvailable actions:")
-            print("1. Move to another room")
-            print("2. Examine items")
-            print("3. Take an item")
-            print("4. View inventory")
-            print("5. Interact with an NPC")
-            print("6. Report the crime")
-            print("q. Quit")
-
-            action = input("Choose an action: ")
-            if action == 'q':
+            for chunk in chunks:
+                print(chunk, end="", flush=True)
+            if state.finished:
+                print()
                 break
-            elif action == '1':
-                print("Which room do you want to go to next? \nRooms:")
-                for i, room in enumerate(current_room.connections):
-                    print(f"{i + 1}. {room.description if room.visited else 'Unexplored Room'}")
-                choice = input("Choose a room to move to: ")
-                try:
-                    index = int(choice) - 1
-                    if 0 <= index < len(current_room.connections):
-                        current_room = current_room.connections[index]
-                        current_room.visited = True
-                    else:
-                        print("Invalid choice. Try again.")
-                except ValueError:
-                    print("Invalid input. Please enter a number.")
-            elif action == '2':
-                current_room.examine_items()
-            elif action == '3':
-                item_name = input("Enter the name of the item you want to take: ")
-                item = current_room.take_item(item_name)
-                if item:
-                    inventory.append(item)
-            elif action == '4':
-                if not inventory:
-                    print("Your inventory is empty.")
-                else:
-                    print("Inventory:")
-                    for item in inventory:
-                        print(f" - {item}")
-            elif action == '5':
-                if current_room.npcs:
-                    print("Which NPC do you want to interact with?")
-                    for i, npc in enumerate(current_room.npcs):
-                        print(f"{i + 1}. {npc}")
-                    choice = input("Choose an NPC to interact with: ")
-                    try:
-                        index = int(choice) - 1
-                        if 0 <= index < len(current_room.npcs):
-                            self._interact_with_npc(current_room.npcs[index])
-                        else:
-                            print("Invalid choice. Try again.")
-                    except ValueError:
-                        print("Invalid input. Please enter a number.")
-                else:
-                    print("There are no NPCs to interact with in this room.")
-            elif action == '6':
-                murderer_guess = input("Enter the name of the murderer: ")
-                item_guess = input("Enter the name of the item you think is the murder weapon: ")
-                if murderer_guess == self.murderer and item_guess in inventory:
-                    print("You correctly identified the murderer and the murder weapon!")
-                    print(f"The murderer is {self.murderer} and the murder weapon is {item_guess}!")
-                    break
-                else:
-                    print("Incorrect guess. Either the murderer or the item is wrong. Try again.")
-            else:
-                print("Invalid action. Please try again.")
+            state, chunks = engine.stream_step(state, input())
 
 if __name__ == "__main__":
     name = input("What is your name? ")
     theme = input("Enter a theme for the game: ")
-    IcosahedronGraph(theme).navigate()
+    IcosahedronGraph(theme, name).navigate()
     
\ No newline at end of file
@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from coalesce import Coalescer
+from metrics import AsyncInstrumentedBackend, InstrumentedBackend, llm_metrics
+from scheduler import AsyncScheduledBackend, ScheduledBackend, scheduler_from_env
+
+load_dotenv()
+
+# Model per call site. Name lists are low stakes and go to a fast model; clue text keeps the
+# strong one. Override any of them with LLM_MODEL_<SITE>, e.g. LLM_MODEL_NAMES=gpt-4o-mini.
+DEFAULT_MODELS = {
+    "names": "gpt-4o-mini",
+    "world": "gpt-4o",
+    "intro": "gpt-4o-mini",
+    "room": "gpt-4o",
+    "examine": "gpt-4",
+    "npc": "gpt-4",
+}
+
+
+def models_from_env():
+    models = dict(DEFAULT_MODELS)
+    for site in models:
+        models[site] = os.environ.get(f"LLM_MODEL_{site.upper()}", models[site])
+    return models
+
+
+class OpenAIBackend:
+    def __init__(self, client=None, models=None):
+        self._client = client
+        self.models = models if models is not None else models_from_env()
+
+    # Created on first use so importing the game never needs an API key
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            # Retries belong to the scheduler, which sees every 429 and Retry-After
+            self._client = OpenAI(api_key=os.environ.get("MY_API_KEY"), max_retries=0)
+        return self._client
+
+    def model_for(self, site):
+        return self.models.get(site, DEFAULT_MODELS.get(site, "gpt-4"))
+
+    def _options(self, site, json_mode, timeout):
+        options = {"model": self.model_for(site)}
+        if json_mode:
+            options["response_format"] = {"type": "json_object"}
+        if timeout is not None:
+            options["timeout"] = timeout
+        return options
+
+    def _record_usage(self, usage, reported):
+        if usage is not None and reported is not None:
+            usage["prompt_tokens"] = reported.prompt_tokens
+            usage["completion_tokens"] = reported.completion_tokens
+
+    # usage, when given, is filled with the token counts the API reports
+    def complete(self, site, messages, json_mode=False, timeout=None, usage=None):
+        response = self.client.chat.completions.create(messages=messages, **self._options(site, json_mode, timeout))
+        self._record_usage(usage, getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    def stream(self, site, messages, timeout=None, usage=None):
+        options = self._options(site, False, timeout)
+        if usage is not None:
+            options["stream_options"] = {"include_usage": True}
+        for chunk in self.client.chat.completions.create(messages=messages, stream=True, **options):
+            self._record_usage(usage, getattr(chunk, "usage", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class AsyncOpenAIBackend(OpenAIBackend):
+    # For the ASGI app: one AsyncOpenAI client, so one pool of keep-alive connections, shared by every
+    # request instead of a blocked worker thread per call
+    def __init__(self, client=None, models=None, max_connections=100):
+        super().__init__(client, models)
+        self.max_connections = max_connections
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self._client = AsyncOpenAI(api_key=os.environ.get("MY_API_KEY"), max_retries=0,
+                                       http_client=httpx.AsyncClient(limits=limits))
+        return self._client
+
+    async def complete(self, site, messages, json_mode=False, timeout=None, usage=None):
+        response = await self.client.chat.completions.create(messages=messages, **self._options(site, json_mode, timeout))
+        self._record_usage(usage, getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    async def stream(self, site, messages, timeout=None, usage=None):
+        options = self._options(site, False, timeout)
+        if usage is not None:
+            options["stream_options"] = {"include_usage": True}
+        async for chunk in await self.client.chat.completions.create(messages=messages, stream=True, **options):
+            self._record_usage(usage, getattr(chunk, "usage", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+WORDS = [
+    "amber", "brass", "cedar", "dusk", "ember", "frost", "gilded", "hollow", "ivory", "jade",
+    "kestrel", "lantern", "marble", "north", "onyx", "pewter", "quill", "raven", "silver", "thorn",
+    "umber", "velvet", "willow", "yew",
+]
+
+
+class StubRateLimitError(Exception):
+    # Shaped like openai.RateLimitError (status_code 429, optional Retry-After) for the scheduler
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("Rate limit reached (stub)")
+        self.retry_after = retry_after
+
+
+class StubBackend:
+    # Offline stand-in that answers every call site with deterministic text derived from the prompt.
+    # latency (seconds per call) and jitter (+/- seconds) simulate a network round trip; error_rate
+    # fails that share of calls with a 429, asking for retry_after seconds when it is set.
+    def __init__(self, latency=0.0, jitter=0.0, seed=0, models=None, error_rate=0.0, retry_after=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.errors = 0
+        self.models = models if models is not None else dict(DEFAULT_MODELS)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def model_for(self, site):
+        return self.models.get(site, "stub")
+
+    def _delay(self):
+        with self.lock:
+            self.calls += 1
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter) if self.jitter else self.latency)
+
+    def _fail(self):
+        with self.lock:
+            failed = self.error_rate and self.random.random() < self.error_rate
+            self.errors += 1 if failed else 0
+        if failed:
+            raise StubRateLimitError(self.retry_after)
+
+    def _wait(self):
+        delay = self._delay()
+        if delay > 0:
+            time.sleep(delay)
+        self._fail()
+
+    def _names(self, seed, label, count):
+        digest = hashlib.sha256(seed.encode()).digest()
+        names = []
+        for i in range(count):
+            word = WORDS[(digest[i % len(digest)] + i) % len(WORDS)]
+            names.append(f"{word.title()} {label} {i + 1}")
+        return names
+
+    def _text(self, site, messages):
+        prompt = messages[-1]["content"]
+        system = messages[0]["content"]
+        if site == "names":
+            match = re.search(r"Generate (\d+) unique (.+?) based on the theme '(.*)'", system)
+            count, category, theme = int(match.group(1)), match.group(2), match.group(3)
+            label = category.split()[0].title()
+            return "\n".join(f"{i + 1}. {name}" for i, name in enumerate(self._names(theme + category, label, count)))
+        if site == "world":
+            world = {}
+            for key, count in re.findall(r'"(\w+)": a list of exactly (\d+)', prompt):
+                # Salt with the names already taken so re-requests for missing pieces stay unique
+                world[key] = self._names(system + prompt, key[:-1].title(), int(count))
+            if '"intro"' in prompt:
+                world["intro"] = "You arrive as the investigator to find John Doe dead in a house of 12 rooms and 30 paths."
+            return json.dumps(world)
+        if site == "room":
+            npcs = json.loads(re.search(r"NPCs in the room: (\[.*?\])\. Items", prompt).group(1))
+            items = json.loads(re.search(r"Items in the room: (\[.*\])\.$", prompt, re.M).group(1))
+            digest = hashlib.sha256(prompt.encode()).hexdigest()[:8]
+            flavour = " ".join(WORDS[int(digest[i], 16)] for i in range(8))
+            return json.dumps({
+                "name": f"{WORDS[int(digest, 16) % len(WORDS)].title()} Room {digest[:4]}",
+                "description": f"[room {digest}] {flavour}.",
+                "items": {item: f"[examine {digest}] {item} {flavour}." for item in items},
+                "npcs": {npc: f"[npc {digest}] {npc} {flavour}." for npc in npcs},
+            })
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:8]
+        return f"[{site} {digest}] " + " ".join(WORDS[int(digest[i], 16)] for i in range(8)) + "."
+
+    # Token counts are estimated from word counts
+    def _record_usage(self, usage, messages, text):
+        if usage is not None:
+            usage["prompt_tokens"] = sum(len(message["content"].split()) for message in messages)
+            usage["completion_tokens"] = len(text.split())
+
+    def complete(self, site, messages, json_mode=False, timeout=None, usage=None):
+        self._wait()
+        text = self._text(site, messages)
+        self._record_usage(usage, messages, text)
+        return text
+
+    def stream(self, site, messages, timeout=None, usage=None):
+        self._wait()
+        text = self._text(site, messages)
+        self._record_usage(usage, messages, text)
+        for word in text.split(" "):
+            yield word + " "
+
+
+class AsyncStubBackend(StubBackend):
+    async def complete(self, site, messages, json_mode=False, timeout=None, usage=None):
+        await asyncio.sleep(self._delay())
+        self._fail()
+        text = self._text(site, messages)
+        self._record_usage(usage, messages, text)
+        return text
+
+    async def stream(self, site, messages, timeout=None, usage=None):
+        await asyncio.sleep(self._delay())
+        self._fail()
+        text = self._text(site, messages)
+        self._record_usage(usage, messages, text)
+        for word in text.split(" "):
+            yield word + " "
+
+
+class CoalescingBackend:
+    # Identical completions that are in flight at the same time, such as many players starting the
+    # same theme at once, share a single upstream call. Joined calls show up as "<site>_inflight" hits.
+    def __init__(self, backend):
+        self.backend = backend
+        self.inflight = Coalescer()
+
+    def model_for(self, site):
+        return self.backend.model_for(site)
+
+    async def complete(self, site, messages, json_mode=False, timeout=None):
+        key = (site, json_mode, json.dumps(messages, sort_keys=True))
+        llm_metrics.record_cache(f"{site}_inflight", self.inflight.busy(key))
+        return await self.inflight.run(key, lambda: self.backend.complete(site, messages, json_mode=json_mode, timeout=timeout))
+
+    def stream(self, site, messages, **options):
+        return self.backend.stream(site, messages, **options)
+
+
+_default_backend = None
+_default_lock = threading.Lock()
+_scheduler = None
+
+
+def instrument(backend):
+    return backend if isinstance(backend, InstrumentedBackend) else InstrumentedBackend(backend)
+
+
+# The one scheduler every default backend, threaded or async, shares its rate limits through
+def default_scheduler():
+    global _scheduler
+    with _default_lock:
+        if _scheduler is None:
+            _scheduler = scheduler_from_env()
+        return _scheduler
+
+
+def schedule(backend, scheduler=None):
+    return ScheduledBackend(backend, scheduler or default_scheduler())
+
+
+# LLM_BACKEND=stub runs the whole game offline; STUB_LATENCY/STUB_JITTER shape the fake round trip
+def default_backend():
+    global _default_backend
+    scheduler = default_scheduler()
+    with _default_lock:
+        if _default_backend is None:
+            if os.environ.get("LLM_BACKEND", "openai") == "stub":
+                backend = StubBackend(
+                    latency=float(os.environ.get("STUB_LATENCY", 0)),
+                    jitter=float(os.environ.get("STUB_JITTER", 0)),
+                    error_rate=float(os.environ.get("STUB_ERROR_RATE", 0)),
+                )
+            else:
+                backend = OpenAIBackend()
+            _default_backend = instrument(ScheduledBackend(backend, scheduler))
+        return _default_backend
+
+
+def set_default_backend(backend):
+    global _default_backend
+    with _default_lock:
+        _default_backend = instrument(backend)
+
+
+# A new async backend for an event loop; LLM_MAX_CONNECTIONS sizes its connection pool
+def default_async_backend():
+    if os.environ.get("LLM_BACKEND", "openai") == "stub":
+        backend = AsyncStubBackend(
+            latency=float(os.environ.get("STUB_LATENCY", 0)),
+            jitter=float(os.environ.get("STUB_JITTER", 0)),
+            error_rate=float(os.environ.get("STUB_ERROR_RATE", 0)),
+        )
+    else:
+        backend = AsyncOpenAIBackend(max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", 100)))
+    return CoalescingBackend(AsyncInstrumentedBackend(AsyncScheduledBackend(backend, default_scheduler())))
+
+
+# Accepts a backend, a raw OpenAI-compatible client, or None for the default backend.
+# Every backend handed to the game is instrumented.
+def as_backend(llm):
+    if llm is None:
+        return default_backend()
+    if hasattr(llm, "complete"):
+        return instrument(llm)
+    return instrument(schedule(OpenAIBackend(client=llm)))
@@ -0,0 +1,257 @@
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+# Who is making the current LLM call (session id, when it was queued, ...). Set with call_context().
+_call_context = contextvars.ContextVar("llm_call_context", default={})
+
+
+@contextlib.contextmanager
+def call_context(**values):
+    token = _call_context.set(dict(_call_context.get(), **values))
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_context():
+    return _call_context.get()
+
+
+# Hands a task to a pool thread along with the caller's metrics context and the time it was queued
+def submit(executor, fn, *args):
+    return executor.submit(contextvars.copy_context().run, _queued, time.perf_counter(), fn, *args)
+
+
+def _queued(queued_at, fn, *args):
+    with call_context(queued_at=queued_at):
+        return fn(*args)
+
+
+def _copy_totals(totals):
+    return dict(totals, cache={site: dict(counts) for site, counts in totals["cache"].items()})
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class LLMMetrics:
+    # Aggregates every LLM call per call site and per session, renders them for Prometheus and
+    # optionally writes one JSON line per call to a trace log.
+    def __init__(self, max_sessions=10000):
+        self.lock = threading.Lock()
+        self.sites = {}
+        self.cache = {}
+        self.sessions = OrderedDict()
+        self.max_sessions = max_sessions
+        self.trace = logging.getLogger("enigma.llm.trace")
+        self.trace.propagate = False
+
+    def enable_trace(self, path):
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.trace.addHandler(handler)
+        self.trace.setLevel(logging.INFO)
+
+    def _site(self, site, model):
+        key = (site, model)
+        if key not in self.sites:
+            self.sites[key] = {
+                "calls": 0, "errors": 0, "retries": 0, "wall_seconds": 0.0, "queue_seconds": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "buckets": [0] * len(LATENCY_BUCKETS),
+            }
+        return self.sites[key]
+
+    # Per-session totals, most recently used last; the oldest sessions are dropped past max_sessions
+    def _session(self, session):
+        totals = self.sessions.pop(session, None) or {
+            "calls": 0, "errors": 0, "retries": 0, "wall_seconds": 0.0, "queue_seconds": 0.0, "tokens": 0,
+            "cache_hits": 0, "cache_misses": 0, "cache": {},
+        }
+        self.sessions[session] = totals
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        return totals
+
+    def record_call(self, site, model, wall, queue=0.0, usage=None, error=None, streamed=False, first_token=None):
+        usage = usage or {}
+        context = current_context()
+        session = context.get("session")
+        with self.lock:
+            stats = self._site(site, model)
+            stats["calls"] += 1
+            stats["errors"] += 1 if error else 0
+            stats["retries"] += usage.get("retries", 0)
+            stats["wall_seconds"] += wall
+            stats["queue_seconds"] += queue
+            stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            stats["completion_tokens"] += usage.get("completion_tokens", 0)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if wall <= bound:
+                    stats["buckets"][i] += 1
+            if session:
+                totals = self._session(session)
+                totals["calls"] += 1
+                totals["errors"] += 1 if error else 0
+                totals["retries"] += usage.get("retries", 0)
+                totals["wall_seconds"] += wall
+                totals["queue_seconds"] += queue
+                totals["tokens"] += usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+        if self.trace.handlers:
+            self.trace.info(json.dumps({
+                "ts": time.time(), "site": site, "model": model, "session": session,
+                "wall_s": round(wall, 6), "queue_s": round(queue, 6),
+                "first_token_s": round(first_token, 6) if first_token is not None else None,
+                "prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens"),
+                "retries": usage.get("retries", 0), "streamed": streamed, "error": repr(error) if error else None,
+                "priority": context.get("priority"),
+            }))
+
+    def record_cache(self, site, hit):
+        status = "hit" if hit else "miss"
+        session = current_context().get("session")
+        with self.lock:
+            self.cache[(site, status)] = self.cache.get((site, status), 0) + 1
+            if session:
+                totals = self._session(session)
+                totals["cache_hits" if hit else "cache_misses"] += 1
+                counts = totals["cache"].setdefault(site, {"hit": 0, "miss": 0})
+                counts[status] += 1
+        if self.trace.handlers:
+            self.trace.info(json.dumps({"ts": time.time(), "site": site, "cache": status, "session": session}))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "sites": [
+                    dict({key: value for key, value in stats.items() if key != "buckets"}, site=site, model=model)
+                    for (site, model), stats in self.sites.items()
+                ],
+                "cache": [{"site": site, "status": status, "count": count} for (site, status), count in self.cache.items()],
+                "sessions": {session: _copy_totals(totals) for session, totals in self.sessions.items()},
+            }
+
+    def session(self, session_id):
+        with self.lock:
+            totals = self.sessions.get(session_id)
+            return _copy_totals(totals) if totals else {}
+
+    def prometheus(self):
+        with self.lock:
+            lines = []
+
+            def metric(name, kind, help_text, samples):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(samples)
+
+            sites = sorted(self.sites.items())
+            metric("enigma_llm_calls_total", "counter", "LLM calls by call site and model.",
+                   [f"enigma_llm_calls_total{_labels(site=s, model=m)} {v['calls']}" for (s, m), v in sites])
+            metric("enigma_llm_errors_total", "counter", "LLM calls that raised.",
+                   [f"enigma_llm_errors_total{_labels(site=s, model=m)} {v['errors']}" for (s, m), v in sites])
+            metric("enigma_llm_retries_total", "counter", "Retries made before an LLM call finished.",
+                   [f"enigma_llm_retries_total{_labels(site=s, model=m)} {v['retries']}" for (s, m), v in sites])
+            metric("enigma_llm_queue_seconds_total", "counter", "Time LLM calls waited before being sent.",
+                   [f"enigma_llm_queue_seconds_total{_labels(site=s, model=m)} {v['queue_seconds']}" for (s, m), v in sites])
+            metric("enigma_llm_tokens_total", "counter", "Tokens used by LLM calls.",
+                   [f"enigma_llm_tokens_total{_labels(site=s, model=m, kind=kind)} {v[kind + '_tokens']}"
+                    for (s, m), v in sites for kind in ("prompt", "completion")])
+            samples = []
+            for (s, m), v in sites:
+                for bound, count in zip(LATENCY_BUCKETS, v["buckets"]):
+                    samples.append(f"enigma_llm_call_seconds_bucket{_labels(site=s, model=m, le=bound)} {count}")
+                samples.append(f"enigma_llm_call_seconds_bucket{_labels(site=s, model=m, le='+Inf')} {v['calls']}")
+                samples.append(f"enigma_llm_call_seconds_sum{_labels(site=s, model=m)} {v['wall_seconds']}")
+                samples.append(f"enigma_llm_call_seconds_count{_labels(site=s, model=m)} {v['calls']}")
+            metric("enigma_llm_call_seconds", "histogram", "Wall time of LLM calls.", samples)
+            metric("enigma_llm_cache_lookups_total", "counter", "Cache lookups in front of LLM calls.",
+                   [f"enigma_llm_cache_lookups_total{_labels(site=s, status=status)} {count}"
+                    for (s, status), count in sorted(self.cache.items())])
+            return "\n".join(lines) + "\n"
+
+
+llm_metrics = LLMMetrics()
+
+
+class InstrumentedBackend:
+    # Wraps any backend and records every call in LLMMetrics
+    def __init__(self, backend, metrics=None):
+        self.backend = backend
+        self.metrics = metrics or llm_metrics
+
+    def model_for(self, site):
+        return self.backend.model_for(site)
+
+    # Time spent in a thread pool queue before the call started, plus any scheduler wait it reports
+    def _queue_time(self, started, usage=None):
+        queued_at = current_context().get("queued_at")
+        waited = usage.get("queue_seconds", 0.0) if usage else 0.0
+        return (max(0.0, started - queued_at) if queued_at is not None else 0.0) + waited
+
+    def complete(self, site, messages, **options):
+        usage = {}
+        started = time.perf_counter()
+        try:
+            text = self.backend.complete(site, messages, usage=usage, **options)
+        except Exception as e:
+            self.metrics.record_call(site, self.model_for(site), time.perf_counter() - started, self._queue_time(started, usage), usage, error=e)
+            raise
+        self.metrics.record_call(site, self.model_for(site), time.perf_counter() - started, self._queue_time(started, usage), usage)
+        return text
+
+    def stream(self, site, messages, **options):
+        usage = {}
+        started = time.perf_counter()
+        first_token = None
+        error = None
+        try:
+            for chunk in self.backend.stream(site, messages, usage=usage, **options):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.metrics.record_call(site, self.model_for(site), time.perf_counter() - started, self._queue_time(started, usage),
+                                     usage, error=error, streamed=True, first_token=first_token)
+
+
+class AsyncInstrumentedBackend(InstrumentedBackend):
+    # The same accounting for backends whose complete() is a coroutine and stream() an async generator
+    async def complete(self, site, messages, **options):
+        usage = {}
+        started = time.perf_counter()
+        try:
+            text = await self.backend.complete(site, messages, usage=usage, **options)
+        except Exception as e:
+            self.metrics.record_call(site, self.model_for(site), time.perf_counter() - started, self._queue_time(started, usage), usage, error=e)
+            raise
+        self.metrics.record_call(site, self.model_for(site), time.perf_counter() - started, self._queue_time(started, usage), usage)
+        return text
+
+    async def stream(self, site, messages, **options):
+        usage = {}
+        started = time.perf_counter()
+        first_token = None
+        error = None
+        try:
+            async for chunk in self.backend.stream(site, messages, usage=usage, **options):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.metrics.record_call(site, self.model_for(site), time.perf_counter() - started, self._queue_time(started, usage),
+                                     usage, error=error, streamed=True, first_token=first_token)
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import call_context, submit
+from scheduler import Promotion
+
+
+class Prefetcher:
+    # Runs LLM calls a player is likely to need next while they read or type. Each session (owner)
+    # keeps at most `budget` speculative results in flight or waiting to be used, and calls that are
+    # thrown away count against `max_wasted`; once a session has wasted that many it stops speculating.
+    # Results are keyed by what they answer, so they are found again after a session is saved and loaded.
+    def __init__(self, max_workers=8, budget=6, max_wasted=50, max_entries=4096, max_owners=10000):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self.budget = budget
+        self.max_wasted = max_wasted
+        self.max_entries = max_entries
+        self.max_owners = max_owners
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.owners = OrderedDict()
+        self.counts = {"started": 0, "used": 0, "wasted": 0, "cancelled": 0}
+
+    def _owner(self, owner):
+        state = self.owners.pop(owner, None) or {"keys": set(), "wasted": 0}
+        self.owners[owner] = state
+        while len(self.owners) > self.max_owners:
+            self.owners.popitem(last=False)
+        return state
+
+    def _drop(self, key):
+        owner, future, _ = self.entries.pop(key)
+        if owner in self.owners:
+            self.owners[owner]["keys"].discard(key)
+        if future.cancel():
+            self.counts["cancelled"] += 1
+            return
+        self.counts["wasted"] += 1
+        if owner in self.owners:
+            self.owners[owner]["wasted"] += 1
+
+    # jobs is a list of (key, fn, *args), most likely first. Whatever this owner started earlier that
+    # is not in jobs any more (say, the room it just left) is cancelled or thrown away. Each job waits
+    # for the LLM at speculative priority until someone claims it.
+    def focus(self, owner, jobs):
+        with self.lock:
+            state = self._owner(owner)
+            wanted = {job[0] for job in jobs}
+            for key in [key for key in state["keys"] if key not in wanted]:
+                self._drop(key)
+            for key, fn, *args in jobs:
+                if len(state["keys"]) >= self.budget or state["wasted"] >= self.max_wasted:
+                    break
+                if key in self.entries:
+                    continue
+                promotion = Promotion()
+                with call_context(priority="speculative", promotion=promotion):
+                    self.entries[key] = (owner, submit(self.executor, fn, *args), promotion)
+                state["keys"].add(key)
+                self.counts["started"] += 1
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+
+    # Hands the job for key to a caller about to wait for it. A job that has not started yet is
+    # cancelled, since the caller is quicker making the call itself; one that has is moved up to
+    # interactive priority so it is not stuck behind other players' calls.
+    def _take(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            owner, future, promotion = entry
+            if owner in self.owners:
+                self.owners[owner]["keys"].discard(key)
+            if future.cancel():
+                self.counts["cancelled"] += 1
+                return None
+        promotion.promote()
+        return future
+
+    def _used(self):
+        with self.lock:
+            self.counts["used"] += 1
+
+    # The speculative result for key, waiting for it if it is still running; None if there is none
+    # or it failed, in which case the caller makes the call itself
+    def claim(self, key, timeout=None):
+        future = self._take(key)
+        if future is None:
+            return None
+        try:
+            result = future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            return None
+        self._used()
+        return result
+
+    # claim() for coroutines: waits without blocking the event loop
+    async def aclaim(self, key, timeout=None):
+        future = self._take(key)
+        if future is None:
+            return None
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except Exception:
+            future.cancel()
+            return None
+        self._used()
+        return result
+
+    def forget(self, owner):
+        with self.lock:
+            state = self.owners.pop(owner, None)
+            for key in list(state["keys"]) if state else []:
+                self._drop(key)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, pending=len(self.entries), sessions=len(self.owners),
+                        budget=self.budget, max_wasted=self.max_wasted)
+
+
+# PREFETCH_BUDGET=0 turns speculation off; PREFETCH_MAX_WASTED caps thrown-away calls per session
+prefetcher = Prefetcher(
+    max_workers=int(os.environ.get("PREFETCH_WORKERS", 8)),
+    budget=int(os.environ.get("PREFETCH_BUDGET", 6)),
+    max_wasted=int(os.environ.get("PREFETCH_MAX_WASTED", 50)),
+)
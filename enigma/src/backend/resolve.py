@@ -0,0 +1,134 @@
+import re
+import unicodedata
+
+# Words that carry no meaning in a name or command ("take the key", "talk to Ada")
+STOPWORDS = {"the", "a", "an", "to", "with", "at", "on", "up", "of", "in", "into", "from", "my", "this", "that"}
+MIN_SIMILARITY = 0.5
+MARGIN = 0.15
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"\w+", text))
+
+
+def tokens(text):
+    words = normalize(text).split()
+    return [word for word in words if word not in STOPWORDS] or words
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Edit distance counting a swap of neighbouring letters as one typo ("tlak" for "talk"), giving up
+# as soon as it is certain to exceed `limit`
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def typo_limit(word):
+    return 0 if len(word) < 4 else 1 if len(word) < 8 else 2
+
+
+def _similar(word, other):
+    return word == other or edit_distance(word, other, typo_limit(word)) <= typo_limit(word)
+
+
+class NameIndex:
+    # Matches what a player typed against the room, NPC and item names of one game without an LLM
+    # call. Tried in order, stopping at the first step that finds anything:
+    #   exact (ignoring case, accents and punctuation), every typed word in the name ("knife" for
+    #   "Silver Knife"), every typed word in the name allowing a typo or two per word, then the
+    #   closest name by character trigrams if it is clearly ahead of the runner-up.
+    # Names are precomputed once per game, so a lookup over a few dozen names takes microseconds.
+    def __init__(self, names):
+        self.source = tuple(names)
+        self.names = list(dict.fromkeys(name for name in self.source if name))
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.normalized = [normalize(name) for name in self.names]
+        self.exact = {}
+        for i, key in enumerate(self.normalized):
+            self.exact.setdefault(key, []).append(i)
+        self.tokens = [set(tokens(name)) for name in self.names]
+        self.grams = [trigrams(key) for key in self.normalized]
+
+    # Best matches for text among candidates (default: every name), best first. One result is a
+    # match, several mean the text was ambiguous and none means nothing came close.
+    def matches(self, text, candidates=None):
+        ids = [self.ids[name] for name in candidates if name in self.ids] if candidates is not None else range(len(self.names))
+        ids = list(dict.fromkeys(ids))
+        key = normalize(text)
+        if not key or not ids:
+            return []
+        allowed = set(ids)
+        found = [i for i in self.exact.get(key, []) if i in allowed]
+        if found:
+            return [self.names[i] for i in found]
+        words = set(tokens(text))
+        found = [i for i in ids if words <= self.tokens[i]]
+        if not found:
+            found = [i for i in ids if all(any(_similar(word, token) for token in self.tokens[i]) for word in words)]
+        if found:
+            # Prefer names with the fewest extra words ("key" picks "Key" over "Key Ring")
+            found.sort(key=lambda i: len(self.tokens[i]))
+            best = len(self.tokens[found[0]])
+            return [self.names[i] for i in found if len(self.tokens[i]) == best]
+        grams = trigrams(key)
+        scored = sorted(((2 * len(grams & self.grams[i]) / (len(grams) + len(self.grams[i])), i) for i in ids), reverse=True)
+        scored = [(score, i) for score, i in scored if score >= MIN_SIMILARITY]
+        if not scored:
+            return []
+        if len(scored) == 1 or scored[0][0] - scored[1][0] >= MARGIN:
+            return [self.names[scored[0][1]]]
+        return [self.names[i] for score, i in scored if scored[0][0] - score < MARGIN]
+
+    def resolve(self, text, candidates=None):
+        found = self.matches(text, candidates)
+        return found[0] if len(found) == 1 else None
+
+
+# What players type for each menu action; the first word of a free-text command picks the action
+VERBS = {
+    "1": ["move", "go", "walk", "enter", "head", "travel"],
+    "2": ["examine", "look", "inspect", "search", "investigate"],
+    "3": ["take", "grab", "pick", "get", "collect"],
+    "4": ["inventory", "inv", "bag", "items"],
+    "5": ["interact", "talk", "ask", "speak", "interrogate", "question"],
+    "6": ["report", "accuse", "solve", "arrest"],
+    "q": ["quit", "exit"],
+}
+_ACTIONS = {verb: action for action, verbs in VERBS.items() for verb in verbs}
+
+
+# "grab the silvr knife" -> ("3", "the silvr knife"); (None, command) when no verb is recognised
+def parse_command(command):
+    words = command.split()
+    if not words:
+        return None, command
+    verb = normalize(words[0])
+    action = _ACTIONS.get(verb)
+    if action is None and typo_limit(verb):
+        close = {_ACTIONS[known] for known in _ACTIONS if _similar(verb, known)}
+        action = close.pop() if len(close) == 1 else None
+    if action is None:
+        return None, command
+    rest = words[1:]
+    if action == "3" and rest and normalize(rest[0]) == "up":
+        rest = rest[1:]
+    return action, " ".join(rest)
@@ -0,0 +1,391 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+from metrics import current_context
+
+# Lower goes first. Player-facing calls are "interactive" (the default); speculative prefetch and
+# world pool refills set their priority with call_context(priority=...).
+PRIORITIES = {"interactive": 0, "speculative": 1, "background": 2}
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRY_ERRORS = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError"}
+# Completions are not capped, so each request reserves this many tokens until its usage is known
+COMPLETION_TOKENS = 300
+
+
+def retryable(error):
+    return getattr(error, "status_code", None) in RETRY_STATUS or type(error).__name__ in RETRY_ERRORS
+
+
+def rate_limited(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+# Seconds the server asked us to wait, from the error or its response's Retry-After header
+def retry_after(error):
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages):
+    return sum(len(message["content"]) for message in messages) // 4 + COMPLETION_TOKENS
+
+
+class Promotion:
+    # Travels with a speculative call in call_context(promotion=...). Once a player is waiting for the
+    # result, promote() moves the call's place in the scheduler queue, and any retry, to interactive.
+    def __init__(self):
+        self.promoted = False
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def promote(self):
+        with self.lock:
+            self.promoted = True
+            hooks, self.hooks = self.hooks, []
+        for hook in hooks:
+            hook()
+
+    # Calls hook on promotion; returns True instead when that already happened
+    def watch(self, hook):
+        with self.lock:
+            if not self.promoted:
+                self.hooks.append(hook)
+            return self.promoted
+
+    def unwatch(self, hook):
+        with self.lock:
+            if hook in self.hooks:
+                self.hooks.remove(hook)
+
+
+class Scheduler:
+    # One per process in front of the LLM API. Calls wait in a priority queue until a concurrency slot
+    # and the requests-per-minute and tokens-per-minute buckets allow them; failed calls that are worth
+    # retrying back off exponentially with full jitter. A 429 empties the request bucket, and a
+    # Retry-After pauses every call, so one rate-limited session slows the others down instead of
+    # letting them all hit the limit too.
+    def __init__(self, rpm=500, tpm=200000, max_concurrency=32, max_retries=4, base_delay=0.5, max_delay=20.0, seed=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.random = random.Random(seed)
+        self.cond = threading.Condition()
+        self.waiting = []
+        self.wakers = {}
+        self.sequence = itertools.count()
+        self.active = 0
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.refilled = time.monotonic()
+        self.paused_until = 0.0
+        self.counts = {"calls": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+        self.waited = {priority: 0.0 for priority in PRIORITIES}
+
+    def _refill(self, now):
+        elapsed = now - self.refilled
+        self.refilled = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    # Seconds until a call needing `tokens` fits in both buckets; a call larger than the token
+    # bucket only waits for a full one
+    def _delay(self, now, tokens):
+        delays = [self.paused_until - now]
+        if self.requests < 1:
+            delays.append((1 - self.requests) * 60 / self.rpm)
+        if self.tokens < min(tokens, self.tpm):
+            delays.append((min(tokens, self.tpm) - self.tokens) * 60 / self.tpm)
+        return max(delays)
+
+    # Takes the slot for `ticket` if it is first in line and the budgets allow it. Returns (True, None)
+    # once granted, otherwise (False, seconds to wait or None to wait for a wake-up).
+    def _attempt(self, ticket, tokens):
+        if self.waiting[0] is not ticket or self.active >= self.max_concurrency:
+            return False, None
+        now = time.monotonic()
+        self._refill(now)
+        delay = self._delay(now, tokens)
+        if delay > 0:
+            return False, delay
+        heapq.heappop(self.waiting)
+        self.wakers.pop(ticket[1], None)
+        self.requests -= 1
+        self.tokens -= min(tokens, self.tpm)
+        self.active += 1
+        self.counts["calls"] += 1
+        self._wake()
+        return True, None
+
+    def _granted(self, priority, started):
+        waited = time.monotonic() - started
+        self.waited[priority if priority in self.waited else "interactive"] += waited
+        return waited
+
+    # Threads wait on the condition; an async caller at the head of the line is woken on its own loop
+    def _wake(self):
+        self.cond.notify_all()
+        waker = self.wakers.get(self.waiting[0][1]) if self.waiting else None
+        if waker is not None:
+            waker()
+
+    # Queue entries are [rank, sequence] so that a promotion can change the rank in place; a promotion
+    # that already happened puts the ticket in at interactive rank straight away
+    def _ticket(self, priority, promotion):
+        ticket = [PRIORITIES.get(priority, 0), next(self.sequence)]
+
+        def promote():
+            with self.cond:
+                if ticket[0] and any(waiting is ticket for waiting in self.waiting):
+                    ticket[0] = 0
+                    heapq.heapify(self.waiting)
+                    self._wake()
+
+        if promotion is not None and promotion.watch(promote):
+            ticket[0] = 0
+        return ticket, promote
+
+    # Blocks until this call may go and returns how long it waited
+    def acquire(self, priority, tokens, promotion=None):
+        ticket, promote = self._ticket(priority, promotion)
+        started = time.monotonic()
+        try:
+            with self.cond:
+                heapq.heappush(self.waiting, ticket)
+                while True:
+                    granted, delay = self._attempt(ticket, tokens)
+                    if granted:
+                        return self._granted(priority, started)
+                    self.cond.wait(delay)
+        finally:
+            if promotion is not None:
+                promotion.unwatch(promote)
+
+    # The same for coroutines, waiting on an asyncio.Event instead of a thread. A cancelled caller
+    # leaves the line.
+    async def aacquire(self, priority, tokens, promotion=None):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        ticket, promote = self._ticket(priority, promotion)
+        started = time.monotonic()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass  # the loop has closed
+
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            self.wakers[ticket[1]] = wake
+        try:
+            while True:
+                ready.clear()
+                with self.cond:
+                    granted, delay = self._attempt(ticket, tokens)
+                    if granted:
+                        return self._granted(priority, started)
+                try:
+                    await asyncio.wait_for(ready.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self.cond:
+                if self.wakers.pop(ticket[1], None) is not None:
+                    self.waiting.remove(ticket)
+                    heapq.heapify(self.waiting)
+                    self._wake()
+            raise
+        finally:
+            if promotion is not None:
+                promotion.unwatch(promote)
+
+    # Gives the slot back and settles the token reservation against what the call really used
+    def release(self, reserved, usage=None):
+        with self.cond:
+            self.active -= 1
+            if usage and "prompt_tokens" in usage:
+                used = usage["prompt_tokens"] + usage.get("completion_tokens", 0)
+                self.tokens = min(self.tpm, self.tokens + min(reserved, self.tpm) - used)
+            self._wake()
+
+    # How long to wait before retry number `attempt`, or raises the error when it should not be retried
+    def backoff(self, error, attempt):
+        if not retryable(error) or attempt >= self.max_retries:
+            with self.cond:
+                self.counts["failed"] += 1
+            raise error
+        delay = self.random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        with self.cond:
+            self.counts["retries"] += 1
+            if rate_limited(error):
+                self.counts["rate_limited"] += 1
+                self.requests = min(self.requests, 0.0)
+                wait = retry_after(error)
+                if wait is not None:
+                    self.paused_until = max(self.paused_until, time.monotonic() + wait)
+                    delay = max(delay, wait)
+        return delay
+
+    def stats(self):
+        with self.cond:
+            return dict(self.counts, active=self.active, waiting=len(self.waiting),
+                        requests_available=self.requests, tokens_available=self.tokens,
+                        wait_seconds=dict(self.waited), rpm=self.rpm, tpm=self.tpm,
+                        max_concurrency=self.max_concurrency)
+
+
+def _priority():
+    return current_context().get("priority", "interactive")
+
+
+def _promotion():
+    return current_context().get("promotion")
+
+
+def _finish(usage, attempt_usage, retries, queued):
+    if usage is not None:
+        usage.update(attempt_usage)
+        usage["retries"] = retries
+        usage["queue_seconds"] = queued
+
+
+class ScheduledBackend:
+    # Sends a backend's calls through a Scheduler. Streams are only retried until their first chunk.
+    def __init__(self, backend, scheduler):
+        self.backend = backend
+        self.scheduler = scheduler
+
+    def model_for(self, site):
+        return self.backend.model_for(site)
+
+    def complete(self, site, messages, json_mode=False, timeout=None, usage=None):
+        reserved = estimate_tokens(messages)
+        retries, queued = 0, 0.0
+        while True:
+            queued += self.scheduler.acquire(_priority(), reserved, _promotion())
+            attempt_usage = {}
+            error = None
+            try:
+                text = self.backend.complete(site, messages, json_mode=json_mode, timeout=timeout, usage=attempt_usage)
+            except Exception as e:
+                error = e
+            finally:
+                # Also when the caller is cancelled mid-call, so the slot is never lost
+                self.scheduler.release(reserved, None if error else attempt_usage)
+            _finish(usage, attempt_usage, retries, queued)
+            if error is None:
+                return text
+            delay = self.scheduler.backoff(error, retries)
+            retries += 1
+            queued += delay
+            time.sleep(delay)
+
+    def stream(self, site, messages, timeout=None, usage=None):
+        reserved = estimate_tokens(messages)
+        retries, queued = 0, 0.0
+        while True:
+            queued += self.scheduler.acquire(_priority(), reserved, _promotion())
+            attempt_usage = {}
+            streamed = False
+            released = False
+            try:
+                for chunk in self.backend.stream(site, messages, timeout=timeout, usage=attempt_usage):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                self.scheduler.release(reserved)
+                released = True
+                _finish(usage, attempt_usage, retries, queued)
+                if streamed:
+                    raise
+                delay = self.scheduler.backoff(e, retries)
+                retries += 1
+                queued += delay
+                time.sleep(delay)
+                continue
+            finally:
+                if not released:
+                    self.scheduler.release(reserved, attempt_usage)
+            _finish(usage, attempt_usage, retries, queued)
+            return
+
+
+class AsyncScheduledBackend(ScheduledBackend):
+    # The same for async backends; waiting for a slot takes no thread, and the process's budgets are
+    # shared with the threaded app
+    async def _acquire(self, reserved):
+        return await self.scheduler.aacquire(_priority(), reserved, _promotion())
+
+    async def complete(self, site, messages, json_mode=False, timeout=None, usage=None):
+        reserved = estimate_tokens(messages)
+        retries, queued = 0, 0.0
+        while True:
+            queued += await self._acquire(reserved)
+            attempt_usage = {}
+            error = None
+            try:
+                text = await self.backend.complete(site, messages, json_mode=json_mode, timeout=timeout, usage=attempt_usage)
+            except Exception as e:
+                error = e
+            finally:
+                self.scheduler.release(reserved, None if error else attempt_usage)
+            _finish(usage, attempt_usage, retries, queued)
+            if error is None:
+                return text
+            delay = self.scheduler.backoff(error, retries)
+            retries += 1
+            queued += delay
+            await asyncio.sleep(delay)
+
+    async def stream(self, site, messages, timeout=None, usage=None):
+        reserved = estimate_tokens(messages)
+        retries, queued = 0, 0.0
+        while True:
+            queued += await self._acquire(reserved)
+            attempt_usage = {}
+            streamed = False
+            released = False
+            try:
+                async for chunk in self.backend.stream(site, messages, timeout=timeout, usage=attempt_usage):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                self.scheduler.release(reserved)
+                released = True
+                _finish(usage, attempt_usage, retries, queued)
+                if streamed:
+                    raise
+                delay = self.scheduler.backoff(e, retries)
+                retries += 1
+                queued += delay
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                if not released:
+                    self.scheduler.release(reserved, attempt_usage)
+            _finish(usage, attempt_usage, retries, queued)
+            return
+
+
+# LLM_RPM / LLM_TPM / LLM_MAX_CONCURRENCY / LLM_MAX_RETRIES size the process-wide scheduler
+def scheduler_from_env():
+    return Scheduler(
+        rpm=int(os.environ.get("LLM_RPM", 500)),
+        tpm=int(os.environ.get("LLM_TPM", 200000)),
+        max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 32)),
+        max_retries=int(os.environ.get("LLM_MAX_RETRIES", 4)),
+    )
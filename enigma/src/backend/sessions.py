@@ -0,0 +1,173 @@
+import pickle
+import secrets
+import sqlite3
+import threading
+import time
+
+
+class SessionTooLarge(ValueError):
+    pass
+
+
+class MemoryStore:
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def load(self, session_id):
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            self.sessions[session_id] = (time.time(), entry[1])
+            return entry[1]
+
+    def save(self, session_id, data):
+        with self.lock:
+            self.sessions[session_id] = (time.time(), data)
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def evict_idle(self, cutoff):
+        with self.lock:
+            idle = [session_id for session_id, (last_seen, _) in self.sessions.items() if last_seen < cutoff]
+            for session_id in idle:
+                del self.sessions[session_id]
+            return len(idle)
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+class SQLiteStore:
+    # Shared by every worker process pointed at the same file
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, last_seen REAL NOT NULL, data BLOB NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+            self.db.commit()
+
+    def load(self, session_id):
+        with self.lock:
+            row = self.db.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE sessions SET last_seen = ? WHERE id = ?", (time.time(), session_id))
+            self.db.commit()
+            return row[0]
+
+    def save(self, session_id, data):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sessions (id, last_seen, data) VALUES (?, ?, ?)",
+                (session_id, time.time(), sqlite3.Binary(data)),
+            )
+            self.db.commit()
+
+    def delete(self, session_id):
+        with self.lock:
+            self.db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self.db.commit()
+
+    def evict_idle(self, cutoff):
+        with self.lock:
+            evicted = self.db.execute("DELETE FROM sessions WHERE last_seen < ?", (cutoff,)).rowcount
+            self.db.commit()
+            return evicted
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisStore:
+    # Works with any client exposing the redis-py get/set/expire/delete calls; Redis expires idle keys itself
+    def __init__(self, client, prefix="enigma:session:", idle_timeout=30 * 60):
+        self.client = client
+        self.prefix = prefix
+        self.idle_timeout = idle_timeout
+
+    def load(self, session_id):
+        data = self.client.get(self.prefix + session_id)
+        if data is not None:
+            self.client.expire(self.prefix + session_id, self.idle_timeout)
+        return data
+
+    def save(self, session_id, data):
+        self.client.set(self.prefix + session_id, data, ex=self.idle_timeout)
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+    def evict_idle(self, cutoff):
+        return 0
+
+
+# idle_timeout only matters for Redis, which expires keys itself; the others are swept by SessionManager
+def store_from_url(url, idle_timeout=30 * 60):
+    if not url or url == "memory":
+        return MemoryStore()
+    if url.startswith("sqlite:"):
+        return SQLiteStore(url[len("sqlite:"):])
+    if url.startswith("redis://"):
+        import redis
+        return RedisStore(redis.Redis.from_url(url), idle_timeout=idle_timeout)
+    raise ValueError(f"Unknown session store: {url}")
+
+
+class PickleCodec:
+    def dumps(self, game):
+        return pickle.dumps(game, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class SessionManager:
+    # Keeps one saved game per session id so concurrent players, and several worker processes
+    # sharing a store, never see each other's state. codec is anything with dumps/loads: pickle by
+    # default, or the compact module for the smaller binary format.
+    def __init__(self, store=None, idle_timeout=30 * 60, max_session_bytes=512 * 1024, sweep_interval=60, codec=None):
+        self.store = store if store is not None else MemoryStore()
+        self.codec = codec if codec is not None else PickleCodec()
+        self.idle_timeout = idle_timeout
+        self.max_session_bytes = max_session_bytes
+        self.sweep_interval = sweep_interval
+        self.last_sweep = time.time()
+
+    def create(self, game):
+        session_id = secrets.token_urlsafe(16)
+        self.save(session_id, game)
+        self.sweep()
+        return session_id
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        data = self.store.load(session_id)
+        if data is None:
+            return None
+        return self.codec.loads(data)
+
+    def save(self, session_id, game):
+        data = self.codec.dumps(game)
+        if len(data) > self.max_session_bytes:
+            raise SessionTooLarge(f"Session {session_id} needs {len(data)} bytes, limit is {self.max_session_bytes}")
+        self.store.save(session_id, data)
+
+    def delete(self, session_id):
+        self.store.delete(session_id)
+
+    def sweep(self):
+        now = time.time()
+        if now - self.last_sweep < self.sweep_interval:
+            return 0
+        self.last_sweep = now
+        return self.store.evict_idle(now - self.idle_timeout)
@@ -0,0 +1,344 @@
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import compact
+import engine
+from benchmark import percentile
+from exploration import IcosahedronGraph, WORLD_COUNTS
+from llm import StubBackend, default_backend, set_default_backend
+from prefetch import prefetcher
+from resolve import normalize
+from topology import from_spec
+from world_cache import WorldCache
+
+# Headless QA: builds many worlds across a process pool, lets scripted solvers play each one through
+# the engine and streams one JSON line per world, plus running aggregates, to a file.
+AGENTS = ["direct", "interrogate"]
+# _fit_room_names pads a short room list with "Room N"
+PADDED_ROOM = re.compile(r"Room \d+'*$")
+
+_backend = None
+_cache = None
+
+
+def _init_worker(llm, latency, cache_path):
+    global _backend, _cache
+    if llm == "stub":
+        _backend = StubBackend(latency=latency)
+        set_default_backend(_backend)
+    else:
+        _backend = default_backend()
+    _cache = WorldCache(cache_path, variants=1) if cache_path else None
+    # Solvers know what they will do next, so speculative calls would only be waste
+    prefetcher.budget = 0
+
+
+def _calls():
+    return getattr(_backend, "calls", None)
+
+
+class Solver:
+    # Plays one world through engine.step the way a player would, counting moves between rooms
+    def __init__(self, graph):
+        self.graph = graph
+        self.state, _ = engine.start(graph)
+        self.moves = 0
+        self.turns = 0
+
+    def send(self, command):
+        self.state, response = engine.step(self.state, command)
+        self.turns += 1
+        return response
+
+    def walk_to(self, target):
+        path = self.graph.topology.path(self.state.room_index, target)
+        if path is None:
+            return False
+        for room in path[1:]:
+            self.send("1")
+            self.send(str(list(self.graph.topology.neighbours(self.state.room_index)).index(room) + 1))
+            self.moves += 1
+        return True
+
+    def take(self, item):
+        self.send(item)
+        return item in self.state.inventory
+
+    def accuse(self, murderer, weapon):
+        self.send("6")
+        self.send(murderer)
+        return self.send(weapon)["done"]
+
+
+def room_of(graph, name, attribute):
+    for i, room in enumerate(graph.rooms):
+        if name in getattr(room, attribute):
+            return i
+    return None
+
+
+# Walks straight to the weapon, picks it up and names the murderer
+def play_direct(graph):
+    solver = Solver(graph)
+    weapon_room = room_of(graph, graph.report_item, "items")
+    solved = weapon_room is not None and solver.walk_to(weapon_room)
+    if solved:
+        solver.send("3")
+        solved = solver.take(graph.report_item) and solver.accuse(graph.murderer, graph.report_item)
+    return solver, solved
+
+
+# Questions every NPC, nearest room first, examines the weapon's room, then solves the case
+def play_interrogate(graph):
+    solver = Solver(graph)
+    pending = {i for i, room in enumerate(graph.rooms) if room.npcs}
+    while pending:
+        distances = graph.topology.distances_from(solver.state.room_index)
+        target = min(pending, key=lambda i: (distances[i], i))
+        pending.discard(target)
+        if not solver.walk_to(target):
+            continue
+        for index in range(len(solver.state.room.npcs)):
+            solver.send("5")
+            solver.send(str(index + 1))
+    weapon_room = room_of(graph, graph.report_item, "items")
+    solved = weapon_room is not None and solver.walk_to(weapon_room)
+    if solved:
+        solver.send("2")
+        solver.send("3")
+        solved = solver.take(graph.report_item) and solver.accuse(graph.murderer, graph.report_item)
+    return solver, solved
+
+
+PLAYERS = {"direct": play_direct, "interrogate": play_interrogate}
+
+
+class ObservedGraph(IcosahedronGraph):
+    # Remembers how many room names generation returned before they were trimmed or padded to fit
+    def _fit_room_names(self, names):
+        self.generated_rooms = len(names)
+        return super()._fit_room_names(names)
+
+
+def duplicates(names):
+    keys = [normalize(name) for name in names]
+    return len(keys) - len(set(keys))
+
+
+def name_report(graph):
+    rooms = [room.description for room in graph.rooms if room.description]
+    npcs, items = graph.npcs, graph.items
+    room_keys, npc_keys, item_keys = ({normalize(name) for name in names} for names in (rooms, npcs, items))
+    # Extra room names are dropped by _fit_room_names; extra NPCs and items stay in the game
+    generated_rooms = getattr(graph, "generated_rooms", None)
+    return {
+        "duplicate": {"rooms": duplicates(rooms), "npcs": duplicates(npcs), "items": duplicates(items)},
+        "missing": {
+            "rooms": sum(1 for name in rooms if PADDED_ROOM.match(name)),
+            "npcs": max(0, WORLD_COUNTS["npcs"] - len(npcs)),
+            "items": max(0, WORLD_COUNTS["items"] - len(items)),
+        },
+        "extra": {
+            "rooms": max(0, generated_rooms - graph.topology.size) if generated_rooms is not None else 0,
+            "npcs": max(0, len(npcs) - WORLD_COUNTS["npcs"]),
+            "items": max(0, len(items) - WORLD_COUNTS["items"]),
+        },
+        "shared": len(room_keys & item_keys) + len(room_keys & npc_keys) + len(npc_keys & item_keys),
+    }
+
+
+def simulate_world(index, seed, theme, spec, lazy, batched):
+    random.seed(seed)
+    started = time.perf_counter()
+    calls = _calls()
+    record = {"index": index, "seed": seed, "theme": theme}
+    try:
+        graph = ObservedGraph(theme, "Solver", batched=batched, cache=_cache, topology=from_spec(spec), lazy=lazy)
+    except Exception as e:
+        return dict(record, error=repr(e))
+    record["names"] = name_report(graph)
+    weapon_room = room_of(graph, graph.report_item, "items")
+    murderer_room = room_of(graph, graph.murderer, "npcs")
+    distances = graph.topology.distances_from(0)
+    record["weapon"] = {
+        "room": weapon_room,
+        "distance": distances[weapon_room] if weapon_room is not None else None,
+        "at_crime_scene": weapon_room == graph.crime_scene,
+    }
+    record["murderer_distance"] = distances[murderer_room] if murderer_room is not None else None
+    record["generation_calls"] = _calls() - calls if calls is not None else None
+    record["agents"] = {}
+    for agent in AGENTS:
+        before = _calls()
+        try:
+            # Every agent gets the same untouched world
+            world = graph if agent == AGENTS[-1] else _copy(graph)
+            solver, solved = PLAYERS[agent](world)
+            record["agents"][agent] = {
+                "solved": bool(solved), "moves": solver.moves, "turns": solver.turns,
+                "llm_calls": _calls() - before if before is not None else None,
+            }
+        except Exception as e:
+            record["agents"][agent] = {"solved": False, "error": repr(e)}
+    record["seconds"] = time.perf_counter() - started
+    return record
+
+
+# Through the compact session format rather than copy.deepcopy, which recurses along the room
+# connections and overflows the stack on a few hundred rooms
+def _copy(graph):
+    world = compact.loads(compact.dumps(engine.GameState(graph))).graph
+    world.attach(cache=_cache)
+    return world
+
+
+def simulate_batch(jobs):
+    return [simulate_world(*job) for job in jobs]
+
+
+class Aggregate:
+    def __init__(self):
+        self.worlds = 0
+        self.errors = 0
+        self.agents = {agent: {"solved": 0, "failed": 0, "moves": [], "turns": [], "llm_calls": []} for agent in AGENTS}
+        self.duplicate = {"rooms": 0, "npcs": 0, "items": 0}
+        self.missing = {"rooms": 0, "npcs": 0, "items": 0}
+        self.extra = {"rooms": 0, "npcs": 0, "items": 0}
+        self.shared = 0
+        self.worlds_with_name_issues = 0
+        self.weapon_distance = {}
+        self.weapon_room = {}
+        self.weapon_at_crime_scene = 0
+        self.murderer_distance = {}
+        self.generation_calls = []
+
+    def add(self, record):
+        self.worlds += 1
+        if "error" in record:
+            self.errors += 1
+            return
+        names = record["names"]
+        for category in self.duplicate:
+            self.duplicate[category] += names["duplicate"][category]
+            self.missing[category] += names["missing"][category]
+            self.extra[category] += names["extra"][category]
+        self.shared += names["shared"]
+        if sum(names["duplicate"].values()) + sum(names["missing"].values()) + sum(names["extra"].values()) + names["shared"]:
+            self.worlds_with_name_issues += 1
+        weapon = record["weapon"]
+        _count(self.weapon_distance, weapon["distance"])
+        _count(self.weapon_room, weapon["room"])
+        self.weapon_at_crime_scene += 1 if weapon["at_crime_scene"] else 0
+        _count(self.murderer_distance, record["murderer_distance"])
+        if record["generation_calls"] is not None:
+            self.generation_calls.append(record["generation_calls"])
+        for agent, result in record["agents"].items():
+            stats = self.agents[agent]
+            if not result["solved"]:
+                stats["failed"] += 1
+                continue
+            stats["solved"] += 1
+            stats["moves"].append(result["moves"])
+            stats["turns"].append(result["turns"])
+            if result.get("llm_calls") is not None:
+                stats["llm_calls"].append(result["llm_calls"])
+
+    def summary(self):
+        played = self.worlds - self.errors
+        agents = {}
+        for agent, stats in self.agents.items():
+            agents[agent] = {
+                "solved": stats["solved"],
+                "solve_rate": stats["solved"] / played if played else 0.0,
+                "moves": _spread(stats["moves"]),
+                "turns": _spread(stats["turns"]),
+                "llm_calls": _spread(stats["llm_calls"]),
+            }
+        return {
+            "worlds": self.worlds,
+            "errors": self.errors,
+            "agents": agents,
+            "names": {
+                "duplicate": self.duplicate, "missing": self.missing, "extra": self.extra,
+                "shared_across_categories": self.shared,
+                "worlds_with_issues": self.worlds_with_name_issues,
+            },
+            "weapon": {
+                "distance_from_start": _sorted(self.weapon_distance),
+                "room": _sorted(self.weapon_room),
+                "at_crime_scene": self.weapon_at_crime_scene,
+            },
+            "murderer_distance_from_start": _sorted(self.murderer_distance),
+            "generation_calls": _spread(self.generation_calls),
+        }
+
+
+def _count(histogram, value):
+    histogram[value] = histogram.get(value, 0) + 1
+
+
+def _sorted(histogram):
+    return {str(key): histogram[key] for key in sorted(histogram, key=lambda key: (key is None, key or 0))}
+
+
+def _spread(values):
+    if not values:
+        return {"mean": 0.0, "p50": 0, "p95": 0, "max": 0}
+    return {"mean": sum(values) / len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "max": max(values)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and auto-play many worlds headlessly and report aggregate stats.")
+    parser.add_argument("--worlds", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument("--batch", type=int, default=25, help="worlds per task sent to a worker")
+    parser.add_argument("--llm", choices=["stub", "default"], default="stub",
+                        help="stub runs offline; default uses the configured backend (LLM_BACKEND, OpenAI)")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated stub latency in seconds")
+    parser.add_argument("--cache", help="WorldCache database to serve names and intros from")
+    parser.add_argument("--themes", default="Default Theme", help="comma-separated themes, used in turn")
+    parser.add_argument("--topology", default="icosahedron", help='e.g. "icosahedron", "grid:10x8" or "regular:500:3"')
+    parser.add_argument("--lazy", action="store_true")
+    parser.add_argument("--batched", action="store_true", help="generate each world with one JSON call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report-every", type=int, default=100, help="write a running aggregate every N worlds")
+    parser.add_argument("--output", help="JSON lines file for per-world records and aggregates (default: stdout)")
+    args = parser.parse_args(argv)
+
+    themes = [theme.strip() for theme in args.themes.split(",") if theme.strip()]
+    jobs = [(i, args.seed + i, themes[i % len(themes)], args.topology, args.lazy, args.batched) for i in range(args.worlds)]
+    batches = [jobs[i:i + args.batch] for i in range(0, len(jobs), args.batch)]
+    out = open(args.output, "w") if args.output else sys.stdout
+    aggregate = Aggregate()
+    started = time.perf_counter()
+
+    def write(line):
+        out.write(json.dumps(line) + "\n")
+        out.flush()
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.llm, args.latency, args.cache)) as executor:
+            futures = [executor.submit(simulate_batch, batch) for batch in batches]
+            for future in as_completed(futures):
+                for record in future.result():
+                    aggregate.add(record)
+                    write(dict(record, type="world"))
+                    if aggregate.worlds % args.report_every == 0:
+                        write(dict(aggregate.summary(), type="aggregate", elapsed_s=time.perf_counter() - started))
+        summary = dict(aggregate.summary(), type="summary", elapsed_s=time.perf_counter() - started, config=vars(args))
+        write(summary)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.output:
+        sys.stdout.write(json.dumps(summary, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
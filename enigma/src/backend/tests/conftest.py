@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# The backend is a flat set of modules run from this directory; tests import them the same way
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+# app.py opens its caches and starts its world pool on import; keep both out of the way
+_data = tempfile.mkdtemp()
+os.environ.setdefault("WORLD_CACHE_PATH", os.path.join(_data, "world_cache.db"))
+os.environ.setdefault("CLUE_CACHE_PATH", os.path.join(_data, "clue_cache.db"))
+os.environ.setdefault("POOL_DEPTH", "0")
+os.environ.setdefault("POOL_THEME_DEPTH", "0")
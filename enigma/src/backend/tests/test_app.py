@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+import app as server
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def events(response):
+    parsed = []
+    for event in response.get_data(as_text=True).split("\n\n"):
+        if event:
+            lines = dict(line.split(": ", 1) for line in event.split("\n"))
+            parsed.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return parsed
+
+
+def test_streamed_narration_is_saved_with_the_game(client, monkeypatch):
+    # Without speculation the NPC's text is generated while streaming, under the player's session
+    monkeypatch.setattr(server.prefetcher, "budget", 0)
+    started = events(client.post("/start/stream", json={"name": "Ada", "theme": "Noir"}))
+    kind, done = started[-1]
+    assert kind == "done"
+    session_id = done["session_id"]
+    assert server.sessions.get(session_id).graph.intro
+
+    # Move an NPC next to the player so the next turn streams an interaction
+    state = server.sessions.get(session_id)
+    npc = state.graph.npcs[0]
+    for room in state.graph.rooms:
+        if npc in room.npcs:
+            room.npcs.remove(npc)
+    state.room.npcs.insert(0, npc)
+    server.sessions.save(session_id, state)
+
+    client.post("/input/stream", json={"session_id": session_id, "input": "5"}).get_data()
+    talked = events(client.post("/input/stream", json={"session_id": session_id, "input": "1"}))
+    assert talked[-1] == ("done", {"session_id": session_id})
+    assert server.sessions.get(session_id).graph.clues.stats()["entries"] == 1
+    assert server.llm_metrics.session(session_id)["calls"] >= 1
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("quart")
+
+import async_app  # noqa: E402
+from llm import default_backend  # noqa: E402
+from prefetch import prefetcher  # noqa: E402
+
+
+def _calls(backend):
+    while hasattr(backend, "backend"):
+        backend = backend.backend
+    return backend.calls
+
+
+def test_start_and_input():
+    async def play():
+        client = async_app.app.test_client()
+        started = await client.post("/start", json={"name": "Ada", "theme": "Gaslight Opera"})
+        assert started.status_code == 200
+        game = await started.get_json()
+        assert game["story"].endswith("Choose an action: ")
+        moved = await client.post("/input", json={"session_id": game["session_id"], "input": "2"})
+        assert moved.status_code == 200
+        assert (await moved.get_json())["session_id"] == game["session_id"]
+        missing = await client.post("/input", json={"session_id": "nope", "input": "1"})
+        assert missing.status_code == 404
+
+    asyncio.run(play())
+
+
+def test_players_missing_the_pool_share_one_world_build(monkeypatch):
+    # Speculation runs on threads through the threaded backend; keep it out of the call counts
+    monkeypatch.setattr(prefetcher, "budget", 0)
+
+    async def play():
+        client = async_app.app.test_client()
+        before = async_app.builds.stats()
+        threaded, asynchronous = _calls(default_backend()), _calls(async_app.llm)
+        responses = await asyncio.gather(*(
+            client.post("/start", json={"name": name, "theme": "Lighthouse Keepers"}) for name in ("Ada", "Ben", "Cy")
+        ))
+        games = [await response.get_json() for response in responses]
+        assert [response.status_code for response in responses] == [200, 200, 200]
+        assert len({game["session_id"] for game in games}) == 3
+        after = async_app.builds.stats()
+        assert after["leaders"] - before["leaders"] == 1
+        assert after["joined"] - before["joined"] == 2
+        # The world was requested once, through the async client
+        assert _calls(async_app.llm) - asynchronous == 1
+        assert _calls(default_backend()) == threaded
+        metrics = await (await client.get("/coalesce/metrics")).get_json()
+        assert metrics["worlds"]["inflight"] == 0
+
+    asyncio.run(play())
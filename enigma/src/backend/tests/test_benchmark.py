@@ -0,0 +1,16 @@
+from benchmark import run
+
+
+class BrokenClient:
+    # Answers like the Flask app does for an expired session
+    def start(self):
+        return {"messages": [], "prompt": "", "options": [], "done": False}
+
+    def send(self, command):
+        return {"error": "Unknown or expired session. Start a new game."}
+
+
+def test_failed_sessions_are_counted():
+    result = run(lambda i: BrokenClient(), sessions=3, turns=5, seed=0)
+    assert result["failed_sessions"] == 3
+    assert result["session_errors"] == {"KeyError": 3}
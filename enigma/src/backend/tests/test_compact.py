@@ -0,0 +1,44 @@
+import compact
+import engine
+from exploration import IcosahedronGraph
+from llm import StubBackend
+from topology import grid
+
+
+def _snapshot(state):
+    graph = state.graph
+    return (
+        state.room_index, state.inventory, state.pending, state.finished, graph.murderer, graph.report_item,
+        graph.crime_scene, graph.topology.edges, [(room.description, room.npcs, room.items, room.visited) for room in graph.rooms],
+        dict(graph.clues.entries),
+    )
+
+
+def test_round_trip():
+    graph = IcosahedronGraph("Noir", "Ada", llm=StubBackend())
+    state, _ = engine.start(graph)
+    state, _ = engine.step(state, "2")
+    assert _snapshot(compact.loads(compact.dumps(state))) == _snapshot(state)
+
+
+def test_worlds_past_int16_rooms():
+    graph = IcosahedronGraph("Noir", "Ada", llm=StubBackend(), topology=grid(200, 200), lazy=True)
+    state, _ = engine.start(graph)
+    npc = graph.npcs[0]
+    for room in graph.rooms:
+        if npc in room.npcs:
+            room.npcs.remove(npc)
+    graph.rooms[39999].add_npc(npc)
+    restored = compact.loads(compact.dumps(state))
+    assert npc in restored.graph.rooms[39999].npcs
+    assert _snapshot(restored) == _snapshot(state)
+
+
+def test_restored_games_share_their_layout_and_its_distance_rows():
+    graph = IcosahedronGraph("Noir", "Ada", llm=StubBackend(), topology=grid(30, 30))
+    state, _ = engine.start(graph)
+    data = compact.dumps(state)
+    first, second = compact.loads(data), compact.loads(data)
+    assert first.graph.topology is second.graph.topology
+    first.graph.topology.distances_from(899)
+    assert 899 in compact.loads(data).graph.topology.rows
@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from exploration import IcosahedronGraph
+from llm import StubBackend
+
+
+class OverlapStub(StubBackend):
+    # Records the most calls that were in flight at once
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.inflight = 0
+        self.overlap = 0
+        self.counter = threading.Lock()
+
+    def complete(self, site, messages, **options):
+        with self.counter:
+            self.inflight += 1
+            self.overlap = max(self.overlap, self.inflight)
+        try:
+            return super().complete(site, messages, **options)
+        finally:
+            with self.counter:
+                self.inflight -= 1
+
+
+@pytest.mark.parametrize("max_workers, overlap", [(1, 1), (3, 3)])
+def test_construction_requests_names_concurrently(max_workers, overlap):
+    llm = OverlapStub(latency=0.05)
+    graph = IcosahedronGraph("Haunted Manor", "Ada", llm=llm, max_workers=max_workers)
+    assert llm.calls == 3
+    assert llm.overlap == overlap
+    assert len(graph.rooms) == 12
+    assert len(graph.topology.edges) == 30
+    assert sum(len(room.connections) for room in graph.rooms) == 60
+    assert len({room.description for room in graph.rooms}) == 12
+    assert sorted(npc for room in graph.rooms for npc in room.npcs) == sorted(graph.npcs)
+    assert sorted(item for room in graph.rooms for item in room.items) == sorted(graph.items)
+    assert len(graph.npcs) == 5 and len(graph.items) == 8
+
+
+def test_worker_count_does_not_change_the_world():
+    serial = IcosahedronGraph("Haunted Manor", llm=StubBackend(), max_workers=1)
+    concurrent = IcosahedronGraph("Haunted Manor", llm=StubBackend(), max_workers=3)
+    assert [room.description for room in serial.rooms] == [room.description for room in concurrent.rooms]
+    assert serial.npcs == concurrent.npcs and serial.items == concurrent.items
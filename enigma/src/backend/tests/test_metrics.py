@@ -0,0 +1,31 @@
+from metrics import LLMMetrics, call_context
+
+
+def test_session_totals_include_queue_time_retries_and_cache_status():
+    metrics = LLMMetrics()
+    with call_context(session="abc"):
+        metrics.record_call("npc", "gpt-4", 0.5, queue=0.25, usage={"prompt_tokens": 10, "completion_tokens": 5, "retries": 2})
+        metrics.record_call("examine", "gpt-4", 0.1, error=RuntimeError("boom"))
+        metrics.record_cache("examine", True)
+        metrics.record_cache("examine", False)
+        metrics.record_cache("npc", True)
+    metrics.record_cache("npc", True)
+    totals = metrics.session("abc")
+    assert totals["calls"] == 2 and totals["errors"] == 1
+    assert totals["retries"] == 2
+    assert totals["queue_seconds"] == 0.25
+    assert totals["wall_seconds"] == 0.6
+    assert totals["tokens"] == 15
+    assert totals["cache_hits"] == 2 and totals["cache_misses"] == 1
+    assert totals["cache"] == {"examine": {"hit": 1, "miss": 1}, "npc": {"hit": 1, "miss": 0}}
+    assert metrics.session("missing") == {}
+
+
+def test_cache_lookups_alone_create_a_session_entry():
+    metrics = LLMMetrics(max_sessions=1)
+    with call_context(session="a"):
+        metrics.record_cache("intro", True)
+    with call_context(session="b"):
+        metrics.record_cache("intro", False)
+    assert list(metrics.snapshot()["sessions"]) == ["b"]
+    assert metrics.session("b")["cache_misses"] == 1 and metrics.session("b")["calls"] == 0
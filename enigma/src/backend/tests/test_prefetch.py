@@ -0,0 +1,83 @@
+import copy
+import threading
+import time
+
+import engine
+from exploration import IcosahedronGraph
+from llm import StubBackend
+from prefetch import Prefetcher, prefetcher
+from scheduler import ScheduledBackend, Scheduler
+from world_cache import WorldCache
+
+
+def test_speculation_skips_clues_the_shared_store_already_has(monkeypatch):
+    store = WorldCache(variants=1)
+    graph = IcosahedronGraph("Noir", "Ada", llm=StubBackend(), clue_store=store)
+    npc = graph.npcs[0]
+    for room in graph.rooms:
+        if npc in room.npcs:
+            room.npcs.remove(npc)
+    graph.rooms[0].npcs.insert(0, npc)
+    world = copy.deepcopy(graph)
+
+    # The first game talks to the NPC, which puts the clue in the shared store
+    state, _ = engine.start(graph)
+    state, _ = engine.step(state, "5")
+    engine.step(state, "1")
+
+    # A second game on the same world has nothing left to speculate for that NPC
+    world.attach(llm=StubBackend(), clue_store=store)
+    focused = []
+    monkeypatch.setattr(prefetcher, "focus", lambda owner, jobs: focused.append([job[0] for job in jobs]))
+    world.speculate(0)
+    assert focused and ("clue", "Noir") + world._npc_key(npc) not in focused[-1]
+    assert world.clues.stats()["hits"] == world.clues.stats()["misses"] == 0
+    assert world._interact_with_npc(npc) == graph._interact_with_npc(npc)
+    assert world.llm.backend.calls == 0
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_claimed_speculation_jumps_ahead_of_waiting_players():
+    scheduler = Scheduler(max_concurrency=1)
+    backend = ScheduledBackend(StubBackend(), scheduler)
+    prefetcher = Prefetcher(max_workers=1)
+    order = []
+
+    def call(name):
+        text = backend.complete("examine", [{"role": "user", "content": name}])
+        order.append(name)
+        return text
+
+    # Every slot is busy: the speculative call and then two players' calls queue behind it
+    scheduler.acquire("interactive", 1)
+    prefetcher.focus("session", [("key", call, "speculative")])
+    _wait_until(lambda: len(scheduler.waiting) == 1)
+    players = [threading.Thread(target=call, args=(name,)) for name in ("first", "second")]
+    for player in players:
+        player.start()
+    _wait_until(lambda: len(scheduler.waiting) == 3)
+
+    claimed = []
+    claimer = threading.Thread(target=lambda: claimed.append(prefetcher.claim("key", timeout=2)))
+    claimer.start()
+    _wait_until(lambda: all(rank == 0 for rank, _ in scheduler.waiting))
+    scheduler.release(1)
+    for thread in players + [claimer]:
+        thread.join()
+    assert order[0] == "speculative" and claimed[0] is not None
+    assert prefetcher.stats()["used"] == 1
+
+
+def test_claiming_speculation_that_has_not_started_cancels_it():
+    prefetcher = Prefetcher(max_workers=1)
+    blocker = threading.Event()
+    prefetcher.focus("session", [("busy", blocker.wait), ("queued", lambda: "text")])
+    assert prefetcher.claim("queued") is None
+    blocker.set()
+    assert prefetcher.stats()["cancelled"] == 1 and prefetcher.stats()["used"] == 0
@@ -0,0 +1,104 @@
+import pytest
+
+import engine
+from exploration import IcosahedronGraph
+from llm import StubBackend
+from prefetch import prefetcher
+from resolve import NameIndex, edit_distance, parse_command, tokens
+
+NAMES = ["Ada Lovelace", "Adam Smith", "Brother Cadfael", "Silver Knife", "Silver Key", "Key", "Candlestick", "Library"]
+
+
+@pytest.fixture
+def game(monkeypatch):
+    # A world with known names: two NPCs and four items next to the player, and a visited library next door
+    monkeypatch.setattr(prefetcher, "budget", 0)
+    graph = IcosahedronGraph("Noir", "Ada", llm=StubBackend())
+    for room in graph.rooms:
+        room.npcs, room.items = [], []
+    state, _ = engine.start(graph)
+    state.room.npcs = ["Ada Lovelace", "Adam Smith"]
+    state.room.items = ["Silver Knife", "Silver Key", "Key", "Candlestick"]
+    library = state.room.connections[0]
+    library.description, library.visited = "Library", True
+    graph.npcs = ["Ada Lovelace", "Adam Smith", "Brother Cadfael"]
+    graph.items = list(state.room.items)
+    graph.murderer, graph.report_item = "Brother Cadfael", "Candlestick"
+    return state
+
+
+def test_typos_and_swapped_letters_count_as_one_edit():
+    assert edit_distance("tlak", "talk", 1) == 1
+    assert edit_distance("knfie", "knife", 1) == 1
+    assert edit_distance("kinfe", "knife", 2) == 1
+    assert edit_distance("fork", "knife", 1) == 2
+
+
+def test_names_match_despite_case_accents_typos_and_transpositions():
+    index = NameIndex(NAMES)
+    assert index.resolve("ada lovelace") == "Ada Lovelace"
+    assert index.resolve("Adá  Lovelace!") == "Ada Lovelace"
+    assert index.resolve("lovelace") == "Ada Lovelace"
+    assert index.resolve("silvr knfie") == "Silver Knife"
+    assert index.resolve("candelstick") == "Candlestick"
+    assert index.resolve("xylophone") is None
+
+
+def test_ambiguous_names_return_every_candidate():
+    index = NameIndex(NAMES)
+    assert index.matches("silver") == ["Silver Knife", "Silver Key"]
+    assert index.resolve("silver") is None
+    # The name with the fewest extra words wins
+    assert index.resolve("key") == "Key"
+    assert index.resolve("key", ["Silver Key", "Candlestick"]) == "Silver Key"
+
+
+def test_stopwords_are_ignored_unless_they_are_all_there_is():
+    assert tokens("take the key to the library") == ["take", "key", "library"]
+    assert tokens("the") == ["the"]
+    assert NameIndex(NAMES).resolve("the silver knife") == "Silver Knife"
+
+
+def test_commands_are_parsed_from_their_first_word():
+    assert parse_command("grab the silvr knife") == ("3", "the silvr knife")
+    assert parse_command("pick up the key") == ("3", "the key")
+    assert parse_command("tlak to ada") == ("5", "to ada")
+    assert parse_command("go to the library") == ("1", "to the library")
+    assert parse_command("dance wildly") == (None, "dance wildly")
+    assert parse_command("") == (None, "")
+
+
+def test_free_text_moves_and_takes_items(game):
+    state, result = engine.step(game, "pick up the silvr knfie")
+    assert result["messages"][0] == "You take the Silver Knife."
+    assert state.inventory == ["Silver Knife"] and "Silver Knife" not in state.room.items
+
+    state, result = engine.step(state, "go to the libary")
+    assert result["messages"][1] == "You are currently in the Library"
+    assert state.room.description == "Library"
+
+
+def test_ambiguous_names_ask_which_one_was_meant(game):
+    state, result = engine.step(game, "take silver")
+    assert result["messages"][0] == "Did you mean Silver Knife or Silver Key?"
+    assert state.inventory == []
+
+    state, result = engine.step(state, "talk to ad")
+    assert result["messages"][0] == "Invalid input. Please enter a number or a name."
+
+
+def test_accusing_with_a_weapon_reports_both_at_once(game):
+    state, _ = engine.step(game, "take the candlestick")
+    state, result = engine.step(state, "accuse Brother Cadfel with the candlestik")
+    assert state.finished and result["done"]
+    assert result["messages"][1] == "The murderer is Brother Cadfael and the murder weapon is Candlestick!"
+
+
+def test_a_wrong_accusation_can_be_tried_again(game):
+    state, _ = engine.step(game, "take the key")
+    state, result = engine.step(state, "accuse Ada Lovelace using the key")
+    assert not state.finished and state.pending is None
+    assert result["messages"][0].startswith("Incorrect guess.")
+
+    state, result = engine.step(state, "accuse cadfael")
+    assert state.pending == "report_item" and state.murderer_guess == "Brother Cadfael"
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm import AsyncStubBackend, StubBackend, StubRateLimitError
+from scheduler import AsyncScheduledBackend, ScheduledBackend, Scheduler
+
+MESSAGES = [{"role": "system", "content": "You are a narrator."}, {"role": "user", "content": "Describe the hall."}]
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+class CutOffStub(StubBackend):
+    # Sends one chunk and then hits the rate limit
+    def stream(self, site, messages, timeout=None, usage=None):
+        self._delay()
+        yield "The "
+        raise StubRateLimitError()
+
+
+def test_waiting_calls_go_in_priority_order():
+    scheduler = Scheduler(max_concurrency=1)
+    scheduler.acquire("interactive", 1)
+    order = []
+
+    def call(priority):
+        scheduler.acquire(priority, 1)
+        order.append(priority)
+        scheduler.release(1)
+
+    threads = []
+    for priority in ("background", "speculative", "interactive"):
+        threads.append(threading.Thread(target=call, args=(priority,)))
+        threads[-1].start()
+        _wait_until(lambda: len(scheduler.waiting) == len(threads))
+    scheduler.release(1)
+    for thread in threads:
+        thread.join()
+    assert order == ["interactive", "speculative", "background"]
+
+
+def test_calls_wait_for_the_request_bucket():
+    scheduler = Scheduler(rpm=600)
+    scheduler.requests = 0
+    assert scheduler.acquire("interactive", 1) >= 0.09
+
+
+def test_calls_wait_for_the_token_bucket():
+    scheduler = Scheduler(tpm=6000)
+    scheduler.tokens = 0
+    assert scheduler.acquire("interactive", 20) >= 0.19
+
+
+def test_backoff_is_bounded_and_gives_up_after_max_retries():
+    scheduler = Scheduler(max_retries=6, base_delay=0.5, max_delay=4.0, seed=3)
+    for attempt in range(6):
+        for _ in range(50):
+            assert 0 <= scheduler.backoff(StubRateLimitError(), attempt) <= min(4.0, 0.5 * 2 ** attempt)
+    with pytest.raises(StubRateLimitError):
+        scheduler.backoff(StubRateLimitError(), 6)
+    with pytest.raises(ValueError):
+        scheduler.backoff(ValueError("not retryable"), 0)
+
+
+def test_rate_limited_calls_are_retried():
+    stub = StubBackend(error_rate=0.5, seed=1)
+    scheduler = Scheduler(base_delay=0.01, seed=0)
+    usage = {}
+    assert ScheduledBackend(stub, scheduler).complete("examine", MESSAGES, usage=usage)
+    assert stub.errors == 1 and stub.calls == 2
+    assert usage["retries"] == 1
+    assert scheduler.stats()["rate_limited"] == 1 and scheduler.stats()["active"] == 0
+
+
+def test_retry_after_pauses_every_caller():
+    stub = StubBackend(error_rate=0.5, seed=1, retry_after=0.2)
+    scheduler = Scheduler(base_delay=0.01, seed=0)
+    started = time.monotonic()
+    caller = threading.Thread(target=ScheduledBackend(stub, scheduler).complete, args=("examine", MESSAGES))
+    caller.start()
+    _wait_until(lambda: stub.errors == 1)
+    # Another session's call waits out the pause too
+    scheduler.acquire("interactive", 1)
+    assert time.monotonic() - started >= 0.2
+    scheduler.release(1)
+    caller.join()
+    assert stub.calls == 2
+
+
+def test_gives_up_after_max_retries():
+    stub = StubBackend(error_rate=1.0)
+    scheduler = Scheduler(max_retries=2, base_delay=0.001)
+    with pytest.raises(StubRateLimitError):
+        ScheduledBackend(stub, scheduler).complete("examine", MESSAGES)
+    assert stub.calls == 3
+    stats = scheduler.stats()
+    assert stats["retries"] == 2 and stats["failed"] == 1 and stats["active"] == 0
+
+
+def test_streams_are_retried_only_before_the_first_chunk():
+    retried = StubBackend(error_rate=0.5, seed=1)
+    assert "".join(ScheduledBackend(retried, Scheduler(base_delay=0.001)).stream("npc", MESSAGES))
+    assert retried.calls == 2
+
+    cut_off = CutOffStub()
+    scheduler = Scheduler(base_delay=0.001)
+    chunks = []
+    with pytest.raises(StubRateLimitError):
+        for chunk in ScheduledBackend(cut_off, scheduler).stream("npc", MESSAGES):
+            chunks.append(chunk)
+    assert chunks == ["The "]
+    assert cut_off.calls == 1
+    assert scheduler.stats()["retries"] == 0 and scheduler.stats()["active"] == 0
+
+
+def test_async_callers_wait_without_threads():
+    async def run():
+        scheduler = Scheduler(rpm=60000, max_concurrency=2, base_delay=0.001)
+        backend = AsyncScheduledBackend(AsyncStubBackend(latency=0.01, error_rate=0.2, seed=4), scheduler)
+        threads = threading.active_count()
+        calls = [asyncio.ensure_future(backend.complete("examine", MESSAGES)) for _ in range(40)]
+        await asyncio.sleep(0.005)
+        assert threading.active_count() == threads
+        assert len(scheduler.waiting) >= 30
+        await asyncio.gather(*calls)
+        assert scheduler.stats()["active"] == 0 and not scheduler.waiting
+
+    asyncio.run(run())
+
+
+def test_cancelled_async_callers_leave_the_line():
+    async def run():
+        scheduler = Scheduler(max_concurrency=1)
+        await scheduler.aacquire("interactive", 1)
+        waiting = asyncio.ensure_future(scheduler.aacquire("interactive", 1))
+        behind = asyncio.ensure_future(scheduler.aacquire("background", 1))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert len(scheduler.waiting) == 1
+        scheduler.release(1)
+        await asyncio.wait_for(behind, 1)
+        assert scheduler.stats()["active"] == 1 and not scheduler.wakers
+
+    asyncio.run(run())
+
+
+def test_cancelled_async_calls_give_their_slot_back():
+    async def run():
+        scheduler = Scheduler(max_concurrency=1)
+        backend = AsyncScheduledBackend(AsyncStubBackend(latency=1.0), scheduler)
+        call = asyncio.ensure_future(backend.complete("examine", MESSAGES))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["active"] == 1
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert scheduler.stats()["active"] == 0
+        backend.backend.latency = 0.0
+        assert await asyncio.wait_for(backend.complete("examine", MESSAGES), 1)
+
+    asyncio.run(run())
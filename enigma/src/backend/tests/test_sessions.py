@@ -0,0 +1,38 @@
+import sys
+import types
+
+from sessions import RedisStore, store_from_url
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    @classmethod
+    def from_url(cls, url):
+        return cls()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_redis_store_uses_the_configured_idle_timeout(monkeypatch):
+    monkeypatch.setitem(sys.modules, "redis", types.SimpleNamespace(Redis=FakeRedis))
+    store = store_from_url("redis://localhost:6379/0", idle_timeout=90)
+    assert isinstance(store, RedisStore)
+    store.save("abc", b"game")
+    assert store.client.ttls[store.prefix + "abc"] == 90
+    store.client.ttls.clear()
+    assert store.load("abc") == b"game"
+    assert store.client.ttls[store.prefix + "abc"] == 90
@@ -0,0 +1,36 @@
+from llm import StubBackend
+from prefetch import prefetcher
+from simulate import AGENTS, ObservedGraph, name_report, play_direct, play_interrogate, simulate_world
+
+
+class ChattyStub(StubBackend):
+    # Answers every name list with two names more than were asked for
+    def _names(self, seed, label, count):
+        return super()._names(seed, label, count + 2)
+
+
+def test_name_report_counts_extra_names():
+    report = name_report(ObservedGraph("Noir", "Solver", llm=ChattyStub()))
+    assert report["extra"] == {"rooms": 2, "npcs": 2, "items": 2}
+    assert report["missing"] == {"rooms": 0, "npcs": 0, "items": 0}
+
+
+def test_exact_names_report_no_issues():
+    report = name_report(ObservedGraph("Noir", "Solver", llm=StubBackend()))
+    assert report["extra"] == report["missing"] == {"rooms": 0, "npcs": 0, "items": 0}
+    assert sum(report["duplicate"].values()) == report["shared"] == 0
+
+
+def test_scripted_solvers_solve_a_world():
+    for play in (play_direct, play_interrogate):
+        solver, solved = play(ObservedGraph("Noir", "Solver", llm=StubBackend()))
+        assert solved and solver.state.finished
+
+
+def test_every_agent_plays_a_large_world(monkeypatch):
+    # Copying a world with a few hundred linked rooms used to overflow the stack
+    monkeypatch.setattr(prefetcher, "budget", 0)
+    record = simulate_world(0, 7, "Noir", "grid:10x20", True, True)
+    assert "error" not in record
+    for agent in AGENTS:
+        assert record["agents"][agent]["solved"], record["agents"][agent]
@@ -0,0 +1,27 @@
+import pytest
+
+from topology import from_spec, random_regular
+
+
+@pytest.mark.parametrize("size, degree", [(1000, 3), (1000, 4), (1000, 5), (1000, 6), (300, 5), (20, 17), (12, 11), (10, 2)])
+def test_random_regular_graphs_are_simple_regular_and_connected(size, degree):
+    for seed in range(10):
+        topology = random_regular(size, degree, seed=seed)
+        assert all(topology.degree(room) == degree for room in range(size))
+        assert all(a < b for a, b in topology.edges)
+        assert len(set(topology.edges)) == len(topology.edges) == size * degree // 2
+        assert topology.is_connected()
+
+
+def test_random_regular_is_reproducible_from_a_seed():
+    assert random_regular(200, 4, seed=7).edges == random_regular(200, 4, seed=7).edges
+
+
+def test_regular_spec():
+    assert from_spec("regular:300:5").size == 300
+
+
+@pytest.mark.parametrize("size, degree", [(7, 3), (5, 5), (10, 1)])
+def test_impossible_regular_graphs_raise(size, degree):
+    with pytest.raises(ValueError):
+        random_regular(size, degree)
@@ -0,0 +1,20 @@
+from world_cache import WorldCache
+
+
+def test_disk_rows_are_trimmed_to_the_cap_oldest_first(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = WorldCache(path, max_disk_entries=10, variants=2)
+    for i in range(40):
+        cache.put(f"theme {i}", "names", [i])
+    assert cache.rows == 10
+    assert cache.db.execute("SELECT COUNT(*) FROM variants").fetchone()[0] == 10
+    assert WorldCache(path, max_disk_entries=10, variants=1).get("theme 39", "names") == [39]
+    assert WorldCache(path, max_disk_entries=10, variants=1).get("theme 0", "names") is None
+
+
+def test_variants_per_key_are_capped(tmp_path):
+    cache = WorldCache(str(tmp_path / "cache.db"), variants=2)
+    for i in range(5):
+        cache.put("Noir", "names", [i])
+    assert cache.rows == 2
+    assert cache.get("Noir", "names") in ([3], [4])
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from exploration import IcosahedronGraph
+from llm import StubBackend
+
+ROOMS = [f"Room {name}" for name in "ABCDEFGHIJKLMN"]
+
+
+class ScriptedWorld(StubBackend):
+    # Answers "world" calls from a script and records every prompt it was sent
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = list(replies)
+        self.prompts = []
+
+    def complete(self, site, messages, json_mode=False, timeout=None, usage=None):
+        if site != "world":
+            return super().complete(site, messages, json_mode=json_mode, timeout=timeout, usage=usage)
+        self.prompts.append(messages[-1]["content"])
+        reply = self.replies.pop(0) if self.replies else "{}"
+        return reply if isinstance(reply, str) else json.dumps(reply)
+
+
+def test_malformed_world_replies_are_repaired_by_asking_only_for_what_is_missing():
+    llm = ScriptedWorld([
+        # 14 rooms, too few NPCs (one reusing a room name, one blank), items not a list, no intro
+        {"rooms": ROOMS, "npcs": ["room a", "Ada", "  ", "Ada"], "items": "a knife", "intro": ""},
+        {"npcs": ["Ben", "Room B", "Cy", "Dee", "Eve"], "items": [f"Item {i}" for i in range(8)] + ["Ada"],
+         "intro": "You arrive.", "rooms": ["Extra Room"]},
+    ])
+    graph = IcosahedronGraph("Noir", "Ada", llm=llm, batched=True)
+    assert [room.description for room in graph.rooms] == ROOMS[:12]
+    assert graph.npcs == ["Ada", "Ben", "Cy", "Dee", "Eve"]
+    assert graph.items == [f"Item {i}" for i in range(8)]
+    assert graph.intro == "You arrive."
+    assert len(llm.prompts) == 2
+    second = llm.prompts[1]
+    assert '"npcs": a list of exactly 4 unique' in second
+    assert '"items": a list of exactly 8 unique' in second
+    assert '"intro"' in second
+    assert '"rooms"' not in second
+    assert "Do not reuse any of these names: Room A" in second
+
+
+def test_unparseable_replies_are_retried():
+    llm = ScriptedWorld(["not json", json.dumps({"rooms": ROOMS[:12], "npcs": list("ABCDE"), "items": list("FGHIJKLM"), "intro": "Hi."})])
+    graph = IcosahedronGraph("Noir", "Ada", llm=llm, batched=True)
+    assert len(llm.prompts) == 2 and graph.intro == "Hi."
+
+
+def test_incomplete_worlds_raise_after_the_last_attempt():
+    llm = ScriptedWorld([{"rooms": ROOMS[:12], "npcs": ["Ada"], "items": list("FGHIJKLM"), "intro": "Hi."}])
+    with pytest.raises(ValueError, match="missing: {'npcs': 4}"):
+        IcosahedronGraph("Noir", "Ada", llm=llm, batched=True)
+    assert len(llm.prompts) == 3
@@ -0,0 +1,256 @@
+import random
+import threading
+from array import array
+from collections import OrderedDict, deque
+
+UNREACHABLE = 0xFFFF
+# Layouts kept by shared(), so distance rows outlive the request that computed them
+SHARED_TOPOLOGIES = 256
+
+
+class Topology:
+    # Room layout as compressed sparse rows: the neighbours of room i are
+    # targets[offsets[i]:offsets[i + 1]], in the order the edges were given (the same order
+    # Room.connections ends up in). Shortest-path rows are computed by BFS on first use and kept,
+    # so distance queries are a single array lookup afterwards.
+    def __init__(self, size, edges, name="house"):
+        self.size = size
+        self.name = name
+        self.edges = [(a, b) for a, b in edges]
+        neighbours = [[] for _ in range(size)]
+        for a, b in self.edges:
+            neighbours[a].append(b)
+            neighbours[b].append(a)
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        for row in neighbours:
+            self.targets.extend(row)
+            self.offsets.append(len(self.targets))
+        self.rows = {}
+
+    # Distance rows are cheap to rebuild, so saved games leave them out
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["rows"] = {}
+        return state
+
+    def __len__(self):
+        return self.size
+
+    def degree(self, room):
+        return self.offsets[room + 1] - self.offsets[room]
+
+    def neighbours(self, room):
+        return self.targets[self.offsets[room]:self.offsets[room + 1]]
+
+    def distances_from(self, source):
+        row = self.rows.get(source)
+        if row is None:
+            row = array("H", [UNREACHABLE]) * self.size
+            row[source] = 0
+            queue = deque([source])
+            offsets, targets = self.offsets, self.targets
+            while queue:
+                room = queue.popleft()
+                step = row[room] + 1
+                for i in range(offsets[room], offsets[room + 1]):
+                    other = targets[i]
+                    if row[other] == UNREACHABLE:
+                        row[other] = step
+                        queue.append(other)
+            self.rows[source] = row
+        return row
+
+    def precompute(self):
+        for source in range(self.size):
+            self.distances_from(source)
+        return self
+
+    def distance(self, a, b):
+        return self.distances_from(b)[a]
+
+    # The neighbour of `room` that is one step closer to `target`
+    def next_hop(self, room, target):
+        row = self.distances_from(target)
+        for other in self.neighbours(room):
+            if row[other] < row[room]:
+                return other
+        return None
+
+    def path(self, a, b):
+        if self.distance(a, b) == UNREACHABLE:
+            return None
+        path = [a]
+        while path[-1] != b:
+            path.append(self.next_hop(path[-1], b))
+        return path
+
+    def is_connected(self):
+        return self.size == 0 or UNREACHABLE not in self.distances_from(0)
+
+    def to_dict(self):
+        return {"name": self.name, "size": self.size, "offsets": list(self.offsets), "targets": list(self.targets)}
+
+
+_shared = OrderedDict()
+_shared_lock = threading.Lock()
+
+
+# The process's one Topology for this layout. Restored games get their map from here instead of a new
+# Topology, so every session on the same layout reuses the distance rows earlier requests computed.
+# ends is the flat edge list (a0, b0, a1, b1, ...) as saved by compact.
+def shared(size, ends, name="house"):
+    ends = array("l", ends)
+    key = (size, name, ends.tobytes())
+    with _shared_lock:
+        topology = _shared.get(key)
+        if topology is not None:
+            _shared.move_to_end(key)
+            return topology
+    topology = Topology(size, zip(ends[::2], ends[1::2]), name)
+    with _shared_lock:
+        topology = _shared.setdefault(key, topology)
+        _shared.move_to_end(key)
+        while len(_shared) > SHARED_TOPOLOGIES:
+            _shared.popitem(last=False)
+    return topology
+
+
+def icosahedron():
+    return Topology(12, [
+        (0, 1), (0, 2), (0, 3), (0, 4), (0, 5),
+        (1, 2), (1, 5), (1, 6), (1, 7),
+        (2, 3), (2, 7), (2, 8),
+        (3, 4), (3, 8), (3, 9),
+        (4, 5), (4, 9), (4, 10),
+        (5, 6), (5, 10),
+        (6, 7), (6, 10), (6, 11),
+        (7, 8), (7, 11),
+        (8, 9), (8, 11),
+        (9, 10), (9, 11),
+        (10, 11)
+    ], "icosahedron")
+
+
+def tetrahedron():
+    return Topology(4, [(a, b) for a in range(4) for b in range(a + 1, 4)], "tetrahedron")
+
+
+def cube():
+    return Topology(8, [(a, a | bit) for a in range(8) for bit in (1, 2, 4) if not a & bit], "cube")
+
+
+def octahedron():
+    return Topology(6, [(a, b) for a in range(6) for b in range(a + 1, 6) if b != a + 3], "octahedron")
+
+
+def dodecahedron():
+    # Outer pentagon 0-4, middle ten-cycle 5-14, inner pentagon 15-19
+    edges = [(i, (i + 1) % 5) for i in range(5)]
+    edges += [(i, 5 + 2 * i) for i in range(5)]
+    edges += [(5 + j, 5 + (j + 1) % 10) for j in range(10)]
+    edges += [(6 + 2 * i, 15 + i) for i in range(5)]
+    edges += [(15 + i, 15 + (i + 1) % 5) for i in range(5)]
+    return Topology(20, edges, "dodecahedron")
+
+
+def grid(width, height):
+    edges = []
+    for y in range(height):
+        for x in range(width):
+            room = y * width + x
+            if x + 1 < width:
+                edges.append((room, room + 1))
+            if y + 1 < height:
+                edges.append((room, room + width))
+    return Topology(width * height, edges, f"a {width} by {height} grid")
+
+
+def _edge(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+# Random pairing of degree "stubs" per room (the configuration model). Pairs that make a loop or a
+# doubled edge are repaired by swapping endpoints with a random good edge, and separate islands are
+# joined by swapping an edge in one with an edge in another; both keep every room at `degree`, so
+# large graphs never have to start over. Small dense ones can get stuck, and are re-paired up to
+# `attempts` times.
+def random_regular(size, degree, seed=None, attempts=100):
+    if size * degree % 2 or degree >= size:
+        raise ValueError(f"No {degree}-regular graph with {size} rooms")
+    rng = random.Random(seed)
+    # Dense graphs are the complement of a sparse one, which is always connected past half the rooms
+    dense = 2 * degree > size - 1
+    for _ in range(attempts):
+        edges = _regular_pairing(size, size - 1 - degree if dense else degree, rng, connected=not dense)
+        if edges is not None:
+            if dense:
+                edges = sorted({(a, b) for a in range(size) for b in range(a + 1, size)} - set(edges))
+            return Topology(size, edges, f"a {degree}-regular maze")
+    raise ValueError(f"Could not build a connected {degree}-regular graph with {size} rooms")
+
+
+def _regular_pairing(size, degree, rng, connected=True):
+    swaps = size * degree
+    stubs = [room for room in range(size) for _ in range(degree)]
+    rng.shuffle(stubs)
+    edges, present, bad = [], set(), []
+    for a, b in zip(stubs[::2], stubs[1::2]):
+        if a == b or _edge(a, b) in present:
+            bad.append((a, b))
+        else:
+            present.add(_edge(a, b))
+            edges.append(_edge(a, b))
+    while bad:
+        if not edges or not swaps:
+            return None
+        swaps -= 1
+        a, b = bad[-1]
+        i = rng.randrange(len(edges))
+        c, d = edges[i] if rng.random() < 0.5 else edges[i][::-1]
+        first, second = _edge(a, c), _edge(b, d)
+        if a == c or b == d or first == second or first in present or second in present:
+            continue
+        bad.pop()
+        present.discard(edges[i])
+        present.update((first, second))
+        edges[i] = first
+        edges.append(second)
+    edges.sort()
+    topology = Topology(size, edges)
+    while connected and not topology.is_connected():
+        row = topology.distances_from(0)
+        inside = [i for i, (a, b) in enumerate(edges) if row[a] != UNREACHABLE]
+        outside = [i for i, (a, b) in enumerate(edges) if row[a] == UNREACHABLE]
+        if not inside or not outside or not swaps:
+            return None
+        swaps -= 1
+        i, j = rng.choice(inside), rng.choice(outside)
+        (a, b), (c, d) = edges[i], edges[j]
+        edges[i], edges[j] = _edge(a, c), _edge(b, d)
+        edges.sort()
+        topology = Topology(size, edges)
+    return edges
+
+
+SHAPES = {
+    "tetrahedron": tetrahedron,
+    "cube": cube,
+    "octahedron": octahedron,
+    "icosahedron": icosahedron,
+    "dodecahedron": dodecahedron,
+}
+
+
+# "icosahedron", "grid:10x8" or "regular:500:3"
+def from_spec(spec):
+    if spec in SHAPES:
+        return SHAPES[spec]()
+    kind, _, args = spec.partition(":")
+    if kind == "grid":
+        width, height = args.split("x")
+        return grid(int(width), int(height))
+    if kind == "regular":
+        size, degree = args.split(":")[:2]
+        return random_regular(int(size), int(degree))
+    raise ValueError(f"Unknown topology: {spec}")
@@ -0,0 +1,102 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_theme(theme):
+    return " ".join(theme.lower().split())
+
+
+class WorldCache:
+    # Keeps up to `variants` generated results per (theme, category). Until a key has all of its
+    # variants, get() misses so a fresh result is generated and stored; after that, repeat themes
+    # get a random stored variant without an API call.
+    def __init__(self, path=None, max_entries=256, max_disk_entries=10000, ttl=7 * 24 * 3600, variants=3):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.variants = variants
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS variants (key TEXT NOT NULL, created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS variants_key ON variants (key)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS variants_created ON variants (created)")
+            self.db.commit()
+            # Kept up to date on every write, so trimming to max_disk_entries never needs a count
+            self.rows = self.db.execute("SELECT COUNT(*) FROM variants").fetchone()[0]
+
+    def _key(self, theme, category):
+        return f"{normalize_theme(theme)}|{category}"
+
+    def _load(self, key, now):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            entries = self.memory[key]
+        elif self.db is not None:
+            rows = self.db.execute("SELECT created, value FROM variants WHERE key = ? ORDER BY created", (key,))
+            entries = list(rows)
+        else:
+            entries = []
+        fresh = [entry for entry in entries if now - entry[0] < self.ttl]
+        if len(fresh) != len(entries) and self.db is not None:
+            self.rows -= self.db.execute("DELETE FROM variants WHERE key = ? AND created <= ?", (key, now - self.ttl)).rowcount
+            self.db.commit()
+        if fresh:
+            self._remember(key, fresh)
+        else:
+            self.memory.pop(key, None)
+        return fresh
+
+    def _remember(self, key, entries):
+        self.memory[key] = entries
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, theme, category):
+        key = self._key(theme, category)
+        with self.lock:
+            entries = self._load(key, time.time())
+            if len(entries) < self.variants:
+                return None
+            return json.loads(random.choice(entries)[1])
+
+    def put(self, theme, category, value):
+        key = self._key(theme, category)
+        now = time.time()
+        encoded = json.dumps(value)
+        with self.lock:
+            entries = self._load(key, now) + [(now, encoded)]
+            entries = entries[-self.variants:]
+            self._remember(key, entries)
+            if self.db is not None:
+                self.db.execute("INSERT INTO variants (key, created, value) VALUES (?, ?, ?)", (key, now, encoded))
+                self.rows += 1
+                self.rows -= self.db.execute(
+                    "DELETE FROM variants WHERE key = ? AND rowid NOT IN "
+                    "(SELECT rowid FROM variants WHERE key = ? ORDER BY created DESC LIMIT ?)",
+                    (key, key, self.variants),
+                ).rowcount
+                # Only the oldest rows go, found through the created index
+                if self.rows > self.max_disk_entries:
+                    self.rows -= self.db.execute(
+                        "DELETE FROM variants WHERE rowid IN (SELECT rowid FROM variants ORDER BY created LIMIT ?)",
+                        (self.rows - self.max_disk_entries,),
+                    ).rowcount
+                self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM variants")
+                self.db.commit()
+                self.rows = 0
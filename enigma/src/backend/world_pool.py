@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import deque
+
+from metrics import call_context
+from world_cache import normalize_theme
+
+
+class WorldPool:
+    # Keeps fully generated worlds ready so /start only has to pop one and pick a new crime.
+    # `factory(theme)` builds a world; a background thread refills each pool up to its target depth.
+    # Themes that miss `promote_after` times get their own pool, up to `max_pools`.
+    def __init__(self, factory, default_theme="Default Theme", depth=4, theme_depth=2,
+                 themes=(), promote_after=3, max_pools=16):
+        self.factory = factory
+        self.theme_depth = theme_depth
+        self.promote_after = promote_after
+        self.max_pools = max_pools
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.pools = {}
+        self.misses_by_theme = {}
+        self._add_pool(default_theme, depth)
+        for theme in themes:
+            self._add_pool(theme, theme_depth)
+
+    def _add_pool(self, theme, target):
+        self.pools[normalize_theme(theme)] = {
+            "theme": theme,
+            "target": target,
+            "worlds": deque(),
+            "taken_at": deque(),
+            "hits": 0,
+            "misses": 0,
+            "refills": 0,
+            "failures": 0,
+            "last_refill_lag": 0.0,
+            "max_refill_lag": 0.0,
+            "total_refill_lag": 0.0,
+            "total_build_time": 0.0,
+        }
+
+    def take(self, theme):
+        key = normalize_theme(theme)
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                if len(self.misses_by_theme) > 10000:
+                    self.misses_by_theme.clear()
+                self.misses_by_theme[key] = self.misses_by_theme.get(key, 0) + 1
+                if self.misses_by_theme[key] >= self.promote_after and len(self.pools) < self.max_pools:
+                    self._add_pool(theme, self.theme_depth)
+                    del self.misses_by_theme[key]
+                    self.wakeup.set()
+                return None
+            self.wakeup.set()
+            if not pool["worlds"]:
+                pool["misses"] += 1
+                return None
+            pool["hits"] += 1
+            pool["taken_at"].append(time.monotonic())
+            world = pool["worlds"].popleft()
+        world.randomize_crime()
+        return world
+
+    def get_or_build(self, theme):
+        world = self.take(theme)
+        if world is None:
+            world = self.factory(theme)
+        return world
+
+    def _next_pool(self):
+        with self.lock:
+            for pool in self.pools.values():
+                if len(pool["worlds"]) < pool["target"]:
+                    return pool
+        return None
+
+    def refill_once(self):
+        pool = self._next_pool()
+        if pool is None:
+            return False
+        started = time.monotonic()
+        try:
+            world = self.factory(pool["theme"])
+        except Exception:
+            with self.lock:
+                pool["failures"] += 1
+            return False
+        now = time.monotonic()
+        with self.lock:
+            pool["worlds"].append(world)
+            pool["refills"] += 1
+            pool["total_build_time"] += now - started
+            # Lag is measured from the take that emptied a slot until a replacement is ready
+            lag = now - pool["taken_at"].popleft() if pool["taken_at"] else 0.0
+            pool["last_refill_lag"] = lag
+            pool["max_refill_lag"] = max(pool["max_refill_lag"], lag)
+            pool["total_refill_lag"] += lag
+        return True
+
+    # Refills are background work: the LLM scheduler serves players first
+    def _run(self):
+        with call_context(priority="background"):
+            while self.running:
+                if not self.refill_once():
+                    self.wakeup.wait(1.0)
+                    self.wakeup.clear()
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name="world-pool-refill", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def metrics(self):
+        with self.lock:
+            pools = {}
+            for key, pool in self.pools.items():
+                requests = pool["hits"] + pool["misses"]
+                pools[key] = {
+                    "depth": len(pool["worlds"]),
+                    "target": pool["target"],
+                    "hits": pool["hits"],
+                    "misses": pool["misses"],
+                    "hit_rate": pool["hits"] / requests if requests else 0.0,
+                    "refills": pool["refills"],
+                    "failures": pool["failures"],
+                    "pending_refills": len(pool["taken_at"]),
+                    "last_refill_lag": pool["last_refill_lag"],
+                    "max_refill_lag": pool["max_refill_lag"],
+                    "avg_refill_lag": pool["total_refill_lag"] / pool["refills"] if pool["refills"] else 0.0,
+                    "avg_build_time": pool["total_build_time"] / pool["refills"] if pool["refills"] else 0.0,
+                }
+            return {"pools": pools, "unpooled_misses": dict(self.misses_by_theme)}
@@ -1,40 +1,99 @@
 "use client";
 
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Input } from "@/components/ui/input"; // Import the Input component
 import { Button } from "@/components/ui/button"; // Import the Button component
 
-const name = window.prompt("What is your name?")
-const themeName = window.prompt("What is your theme for the game?")
-alert(name)
-alert(themeName)
+// Reads the backend's server-sent events and calls onText for every chunk of narration as it arrives
+const streamFromBackend = async (path: string, body: object, onText: (text: string) => void) => {
+  const response = await fetch(`/api${path}`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+  if (!response.ok || !response.body) {
+    const error = await response.json().catch(() => ({ error: "The narrator is not responding." }));
+    onText(error.error);
+    return null;
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let sessionId: string | null = null;
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop() ?? "";
+    for (const event of events) {
+      const data = event.split("\n").find(line => line.startsWith("data: "));
+      if (!data) continue;
+      const payload = JSON.parse(data.slice("data: ".length));
+      if (event.startsWith("event: done")) {
+        sessionId = payload.session_id;
+      } else if (event.startsWith("event: error")) {
+        onText(`\n${payload.error}`);
+      } else {
+        onText(payload.text);
+      }
+    }
+  }
+  return sessionId;
+};
 
 const TextAdventureGame = () => {
-  const [messages, setMessages] = useState<{ sender: string, text: string }[]>([]);
+  const [messages, setMessages] = useState<{ id: number, sender: string, text: string }[]>([]);
   const [currentMessage, setCurrentMessage] = useState("");
+  const [sessionId, setSessionId] = useState<string | null>(null);
+  const started = useRef(false);
+  const nextId = useRef(0);
+  // Turns are sent one after another, so a turn never reaches the server before the last one is saved
+  const turns = useRef<Promise<unknown>>(Promise.resolve());
+
+  const addMessage = (sender: string, text: string) => {
+    const id = nextId.current++;
+    setMessages(prevMessages => [...prevMessages, { id, sender, text }]);
+    return id;
+  };
+
+  // Adds an empty narrator message and appends streamed text to that message only
+  const narrate = (path: string, body: object) => {
+    const id = addMessage("Narrator", "");
+    const turn = turns.current.then(() => streamFromBackend(path, body, text => {
+      setMessages(prevMessages => prevMessages.map(message =>
+        message.id === id ? { ...message, text: message.text + text } : message
+      ));
+    }));
+    turns.current = turn.catch(() => null);
+    return turn;
+  };
+
+  useEffect(() => {
+    if (started.current) return;
+    started.current = true;
+    const name = window.prompt("What is your name?") || "Player";
+    const theme = window.prompt("What is your theme for the game?") || "Default Theme";
+    narrate("/start/stream", { name, theme }).then(id => { if (id) setSessionId(id); });
+  }, []);
 
   const handleSendMessage = () => {
-    if (currentMessage.trim() !== "") {
+    if (sessionId && currentMessage.trim() !== "") {
       // Add the player's message
-      setMessages([...messages, { sender: "Human", text: currentMessage }]);
+      addMessage("Human", currentMessage);
       // Clear the input field
       setCurrentMessage("");
 
-      // Add a response from the narrator
-      setTimeout(() => {
-        setMessages(prevMessages => [
-          ...prevMessages,
-          { sender: "Narrator", text: currentMessage }
-        ]);
-      }, 500); // Delay to simulate processing time
+      // Stream the narrator's response
+      narrate("/input/stream", { session_id: sessionId, input: currentMessage });
     }
   };
 
   return (
     <div style={{ display: 'flex', flexDirection: 'column', height: '100vh' }}>
       <div style={{ flex: 1, overflowY: 'auto', padding: '16px' }}>
-        {messages.map((message, index) => (
-          <div key={index} style={{ marginBottom: '8px' }}>
+        {messages.map(message => (
+          <div key={message.id} style={{ marginBottom: '8px', whiteSpace: 'pre-wrap' }}>
             <strong>{message.sender}:</strong> {message.text}
           </div>
         ))}
@@ -53,12 +112,13 @@ const TextAdventureGame = () => {
       }}>
         <Input
           type="text"
-          placeholder="Enter your text"
+          placeholder={sessionId ? "Enter your text" : "The narrator is setting the scene..."}
           value={currentMessage}
+          disabled={!sessionId}
           onChange={(e) => setCurrentMessage(e.target.value)}
           style={{ flex: 1, marginRight: '8px' }}
         />
-        <Button onClick={handleSendMessage}>Submit</Button>
+        <Button onClick={handleSendMessage} disabled={!sessionId}>Submit</Button>
       </div>
     </div>
   );